@@ -0,0 +1,351 @@
+import os
+import threading
+import pandas as pd
+from sqlalchemy import text
+
+try:
+    import duckdb
+except ImportError:  # tuỳ chọn: pip install duckdb
+    duckdb = None
+
+# Bản sao dạng cột (DuckDB) của invoices / transactions cho dashboard nhiều năm.
+#
+# Làm mới tăng dần: dòng mới lấy theo watermark khoá chính, còn dòng bị sửa /
+# xoá (kể cả khi chuyển sang archive) được trigger SQLite ghi vào
+# analytics_changes để lấy lại đúng những id đó. Dòng mới có id <= watermark
+# (SQLite dùng lại id sau khi xoá dòng lớn nhất) cũng được ghi vào đó.
+# Bật bằng APP_ANALYTICS=duckdb.
+
+CHANGES_TABLE = "analytics_changes"
+WATERMARKS_TABLE = "analytics_watermarks"
+CHUNK = 100_000
+
+TABLES = {
+    "invoices": {
+        "pk": "invoice_id",
+        "columns": [
+            "invoice_id", "supplier_id", "product_id", "invoice_month", "price",
+            "quantity", "total_amount", "total_paid", "total_debt",
+        ],
+        "ddl": (
+            "invoice_id BIGINT, supplier_id BIGINT, product_id BIGINT, "
+            "invoice_month DATE, price BIGINT, quantity BIGINT, total_amount BIGINT, "
+            "total_paid BIGINT, total_debt BIGINT, archived BOOLEAN"
+        ),
+        "select": (
+            "invoice_id, supplier_id, product_id, "
+            "TRY_CAST(substr(invoice_month, 1, 10) AS DATE), price, quantity, "
+            "total_amount, total_paid, total_debt, archived::BOOLEAN"
+        ),
+    },
+    "transactions": {
+        "pk": "transaction_id",
+        "columns": ["transaction_id", "amount", "type", "category", "transaction_date"],
+        "ddl": (
+            "transaction_id BIGINT, amount BIGINT, type VARCHAR, category VARCHAR, "
+            "transaction_date DATE, archived BOOLEAN"
+        ),
+        "select": (
+            "transaction_id, amount, type, category, "
+            "TRY_CAST(transaction_date AS DATE), archived::BOOLEAN"
+        ),
+    },
+}
+
+
+def is_enabled():
+    return duckdb is not None and os.getenv("APP_ANALYTICS") == "duckdb"
+
+
+def mirror_path(db_path):
+    """database/app.db -> database/app_analytics.duckdb"""
+    return f"{os.path.splitext(db_path)[0]}_analytics.duckdb"
+
+
+def init_change_log(bind):
+    with bind.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} ("
+            "table_name TEXT NOT NULL, row_id INTEGER NOT NULL, "
+            "PRIMARY KEY (table_name, row_id)) WITHOUT ROWID"
+        ))
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {WATERMARKS_TABLE} ("
+            "table_name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)"
+        ))
+        # Không dùng INSERT OR IGNORE: khi lệnh gây trigger là upsert (ON
+        # CONFLICT DO UPDATE), SQLite áp chính sách xung đột của lệnh ngoài
+        # cho trigger nên id đã có trong log làm hỏng cả lệnh
+        for table, spec in TABLES.items():
+            log = (
+                f"INSERT INTO {CHANGES_TABLE}(table_name, row_id) "
+                f"SELECT '{table}', {{ref}}.{spec['pk']} WHERE NOT EXISTS ("
+                f"SELECT 1 FROM {CHANGES_TABLE} WHERE table_name = '{table}' "
+                f"AND row_id = {{ref}}.{spec['pk']});"
+            )
+            # Chỉ ghi dòng mirror đã nạp (id <= watermark): chưa có mirror thì
+            # không có watermark, trigger không ghi gì; dòng > watermark được
+            # nạp lại nguyên ở lần refresh sau
+            def loaded(ref):
+                return (
+                    f"WHEN {ref}.{spec['pk']} <= (SELECT last_id FROM {WATERMARKS_TABLE} "
+                    f"WHERE table_name = '{table}')"
+                )
+
+            for op, ref in (("INSERT", "NEW"), ("UPDATE", "OLD"), ("DELETE", "OLD")):
+                name = f"{CHANGES_TABLE}_{table}_{op.lower()}"
+                ddl = conn.execute(text(
+                    "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = :n"
+                ), {"n": name}).scalar()
+                # Bản cũ của trigger sửa / xoá ghi log cả khi chưa bật mirror
+                if ddl and " WHEN " not in ddl:
+                    conn.execute(text(f"DROP TRIGGER {name}"))
+                    conn.execute(text(
+                        f"DELETE FROM {CHANGES_TABLE} WHERE table_name = '{table}' "
+                        f"AND NOT EXISTS (SELECT 1 FROM {WATERMARKS_TABLE} "
+                        f"WHERE table_name = '{table}')"
+                    ))
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {op} ON {table} "
+                    f"{loaded(ref)} BEGIN {log.format(ref=ref)} END"
+                ))
+
+
+class Mirror:
+    def __init__(self, engine, path=None):
+        self.engine = engine
+        self.path = path or mirror_path(engine.url.database)
+        self.conn = duckdb.connect(self.path)
+        self.lock = threading.Lock()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS _watermarks (table_name VARCHAR, last_id BIGINT)"
+        )
+        for table, spec in TABLES.items():
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({spec['ddl']})")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS suppliers (supplier_id BIGINT, supplier_name VARCHAR)"
+        )
+
+    def _cursor(self):
+        # Mỗi thread (session Streamlit) dùng cursor riêng trên cùng connection
+        return self.conn.cursor()
+
+    def _watermark(self, cur, conn, table):
+        """Watermark trong SQLite; nếu file mirror không khớp (mới tạo, bị xoá,
+        ghi dở) thì trả về 0 để nạp lại toàn bộ bảng."""
+        stored = conn.execute(
+            text(f"SELECT last_id FROM {WATERMARKS_TABLE} WHERE table_name = :t"),
+            {"t": table}
+        ).scalar() or 0
+        row = cur.execute(
+            "SELECT last_id FROM _watermarks WHERE table_name = ?", [table]
+        ).fetchone()
+        return stored if row and row[0] == stored else 0
+
+    def _source_sql(self, table, where):
+        spec = TABLES[table]
+        cols = ", ".join(spec["columns"])
+        return (
+            f"SELECT {cols}, 0 AS archived FROM main.{table} WHERE {where} "
+            f"UNION ALL SELECT {cols}, 1 AS archived FROM archive.{table} WHERE {where}"
+        )
+
+    def _load(self, cur, table, result):
+        spec = TABLES[table]
+        columns = spec["columns"] + ["archived"]
+        count = 0
+        while True:
+            rows = result.fetchmany(CHUNK)
+            if not rows:
+                return count
+            chunk = pd.DataFrame(rows, columns=columns)
+            cur.register("chunk", chunk)
+            cur.execute(f"INSERT INTO {table} SELECT {spec['select']} FROM chunk")
+            cur.unregister("chunk")
+            count += len(rows)
+
+    def _pending(self, conn, table, watermark):
+        pk = TABLES[table]["pk"]
+        has_changes = conn.execute(
+            text(f"SELECT 1 FROM {CHANGES_TABLE} WHERE table_name = :t LIMIT 1"),
+            {"t": table}
+        ).first()
+        newest = conn.execute(text(
+            f"SELECT MAX(m) FROM (SELECT MAX({pk}) AS m FROM main.{table} "
+            f"UNION ALL SELECT MAX({pk}) FROM archive.{table})"
+        )).scalar() or 0
+        return bool(has_changes) or newest > watermark
+
+    def refresh_table(self, table):
+        pk = TABLES[table]["pk"]
+        cur = self._cursor()
+
+        with self.engine.connect() as conn:
+            watermark = self._watermark(cur, conn, table)
+            if not self._pending(conn, table, watermark):
+                return 0
+
+        # Xoá change log, đọc dữ liệu và lưu watermark trong cùng một
+        # transaction SQLite; nếu ghi DuckDB lỗi thì rollback để lần sau làm lại.
+        with self.engine.begin() as conn:
+            watermark = self._watermark(cur, conn, table)
+            changed = [r[0] for r in conn.execute(text(
+                f"DELETE FROM {CHANGES_TABLE} WHERE table_name = :t RETURNING row_id"
+            ), {"t": table})]
+
+            cur.execute("BEGIN TRANSACTION")
+            try:
+                # Xoá luôn phần > watermark để lần nạp lại sau lỗi không bị trùng
+                cur.execute(f"DELETE FROM {table} WHERE {pk} > ?", [watermark])
+                count = 0
+                if changed:
+                    cur.execute(
+                        f"DELETE FROM {table} WHERE {pk} IN (SELECT UNNEST(?::BIGINT[]))",
+                        [changed]
+                    )
+                    result = conn.execute(
+                        text(self._source_sql(
+                            table,
+                            f"{pk} <= :wm AND {pk} IN (SELECT value FROM json_each(:ids))"
+                        )),
+                        {"wm": watermark, "ids": "[" + ",".join(map(str, changed)) + "]"}
+                    )
+                    count += self._load(cur, table, result)
+
+                result = conn.execute(
+                    text(self._source_sql(table, f"{pk} > :wm")), {"wm": watermark}
+                )
+                count += self._load(cur, table, result)
+
+                newest = max(
+                    cur.execute(f"SELECT MAX({pk}) FROM {table}").fetchone()[0] or 0,
+                    watermark
+                )
+                cur.execute("DELETE FROM _watermarks WHERE table_name = ?", [table])
+                cur.execute("INSERT INTO _watermarks VALUES (?, ?)", [table, newest])
+                conn.execute(text(
+                    f"INSERT INTO {WATERMARKS_TABLE}(table_name, last_id) VALUES (:t, :id) "
+                    "ON CONFLICT(table_name) DO UPDATE SET last_id = excluded.last_id"
+                ), {"t": table, "id": newest})
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return count
+
+    def refresh(self):
+        with self.lock:
+            counts = {table: self.refresh_table(table) for table in TABLES}
+
+            cur = self._cursor()
+            with self.engine.connect() as conn:
+                suppliers = pd.DataFrame(
+                    conn.execute(text("SELECT supplier_id, supplier_name FROM suppliers")).all(),
+                    columns=["supplier_id", "supplier_name"]
+                )
+            cur.register("suppliers_df", suppliers)
+            cur.execute("CREATE OR REPLACE TABLE suppliers AS SELECT * FROM suppliers_df")
+            cur.unregister("suppliers_df")
+            return counts
+
+    # DASHBOARD: cùng tên / kết quả với InvoiceRepository
+    def _query(self, sql, params=None):
+        return self._cursor().execute(sql, params or []).df()
+
+    @staticmethod
+    def _scope(include_archive):
+        return "TRUE" if include_archive else "NOT archived"
+
+    def totals(self, include_archive=False):
+        total, paid, debt = self._cursor().execute(
+            "SELECT COALESCE(SUM(total_amount), 0), COALESCE(SUM(total_paid), 0), "
+            f"COALESCE(SUM(total_debt), 0) FROM invoices WHERE {self._scope(include_archive)}"
+        ).fetchone()
+        return {"Tổng tiền": int(total), "Đã trả": int(paid), "Còn nợ": int(debt)}
+
+    def debt_by_supplier(self, include_archive=False):
+        return self._query(
+            'SELECT s.supplier_name AS "Nhà cung cấp", SUM(i.total_debt)::BIGINT AS "Còn nợ" '
+            "FROM invoices i JOIN suppliers s USING (supplier_id) "
+            f"WHERE {self._scope(include_archive)} "
+            'GROUP BY s.supplier_id, s.supplier_name ORDER BY "Còn nợ" DESC'
+        )
+
+    def monthly_totals(self, include_archive=False):
+        return self._query(
+            "SELECT strftime(invoice_month, '%Y-%m') AS \"Tháng\", "
+            'SUM(total_amount)::BIGINT AS "Tổng tiền", SUM(total_debt)::BIGINT AS "Còn nợ" '
+            f"FROM invoices WHERE {self._scope(include_archive)} "
+            "GROUP BY 1 ORDER BY 1"
+        )
+
+    def _finance_summary(self, period, label, include_archive):
+        df = self._query(
+            f"SELECT {period} AS period, "
+            "SUM(CASE WHEN type = 'Thu nhập' THEN amount ELSE 0 END)::BIGINT AS \"Thu\", "
+            "SUM(CASE WHEN type = 'Chi tiêu' THEN amount ELSE 0 END)::BIGINT AS \"Chi\" "
+            f"FROM transactions WHERE {self._scope(include_archive)} "
+            "GROUP BY 1 ORDER BY 1"
+        )
+        df.insert(0, label[0], label[1](df.pop("period")))
+        df["Tổng"] = df["Thu"] - df["Chi"]
+        return df
+
+    def finance_monthly(self, include_archive=False):
+        return self._finance_summary(
+            "date_trunc('month', transaction_date)",
+            ("Tháng", lambda s: pd.to_datetime(s).dt.strftime("%b-%Y")),
+            include_archive
+        )
+
+    def finance_yearly(self, include_archive=False):
+        return self._finance_summary(
+            "year(transaction_date)",
+            ("Năm", lambda s: s.astype("int64")),
+            include_archive
+        )
+
+    def finance_date_bounds(self, include_archive=False):
+        first, last = self._cursor().execute(
+            "SELECT min(transaction_date), max(transaction_date) FROM transactions "
+            f"WHERE {self._scope(include_archive)}"
+        ).fetchone()
+        return (first, last) if first else None
+
+    def finance_series(self, start=None, end=None, period="day", include_archive=False):
+        # Cùng kết quả với TransactionRepository.series (tuần bắt đầu thứ Hai)
+        where, params = [self._scope(include_archive)], []
+        if start is not None:
+            where.append("transaction_date >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("transaction_date <= ?")
+            params.append(end)
+        bucket = "transaction_date" if period == "day" else "date_trunc('week', transaction_date)"
+        df = self._query(
+            f'SELECT {bucket}::TIMESTAMP AS "Ngày", '
+            "SUM(CASE WHEN type = 'Thu nhập' THEN amount ELSE 0 END)::BIGINT AS \"Thu\", "
+            "SUM(CASE WHEN type = 'Chi tiêu' THEN amount ELSE 0 END)::BIGINT AS \"Chi\" "
+            f"FROM transactions WHERE {' AND '.join(where)} GROUP BY 1 ORDER BY 1",
+            params
+        )
+        df["Tổng"] = df["Thu"] - df["Chi"]
+        return df
+
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_mirror(engine, refresh=True):
+    """Mirror đã làm mới của engine, hoặc None khi chưa bật / chưa cài duckdb"""
+    if not is_enabled():
+        return None
+    path = mirror_path(engine.url.database)
+    with _mirrors_lock:
+        mirror = _mirrors.get(path)
+        if mirror is None:
+            mirror = _mirrors[path] = Mirror(engine, path)
+    if refresh:
+        mirror.refresh()
+    return mirror
@@ -1,5 +1,7 @@
 import streamlit as st
-from models import init_db
+from models import init_db, session_scope
+from services.archive import archive_old_data, KEEP_MONTHS
+from services import backup
 
 st.set_page_config(page_title="Management App", layout="wide")
 init_db()
@@ -10,6 +12,45 @@ st.page_link("pages/Invoice.py", label="Quản lý hoá đơn")
 st.page_link("pages/Reminder.py", label="Quản lý văn kiện")
 st.page_link("pages/Todo.py", label="Quản lý công việc")
 st.page_link("pages/Finance.py", label="Quản lý chi tiêu")
+st.page_link("pages/Search.py", label="Tìm kiếm")
+
+with st.expander("🗄️ Lưu trữ dữ liệu cũ"):
+    st.caption(
+        "Chuyển hoá đơn đã trả đủ và giao dịch của các năm đã đóng sổ sang "
+        "database lưu trữ. Dữ liệu vẫn xem được khi bật \"Gồm dữ liệu lưu trữ\"."
+    )
+    keep_months = st.number_input(
+        "Giữ lại hoá đơn đã trả đủ của N tháng gần nhất",
+        min_value=0,
+        value=KEEP_MONTHS,
+        step=1
+    )
+    if st.button("🗄️ Chuyển sang lưu trữ"):
+        with session_scope() as session:
+            moved = archive_old_data(session, keep_months=keep_months)
+        st.success(
+            f"✅ Đã lưu trữ {moved['invoices']} hoá đơn, {moved['transactions']} giao dịch"
+        )
+
+with st.expander("💾 Sao lưu dữ liệu"):
+    st.caption(
+        "Chụp database đang chạy bằng backup API của SQLite, vẫn ghi được trong "
+        "lúc sao lưu. Mỗi bản được kiểm tra integrity trước khi lưu vào "
+        "database/backups; khôi phục bằng python -m services.backup restore."
+    )
+    if st.button("💾 Tạo bản sao lưu"):
+        with st.spinner("Đang sao lưu..."):
+            folder, removed = backup.scheduled_snapshot()
+        if folder:
+            st.success(f"✅ Đã tạo {folder}, xoá {len(removed)} bản cũ")
+        else:
+            st.info("Database không đổi từ bản sao lưu gần nhất")
+    snapshots = backup.list_snapshots()
+    for s in snapshots[:10]:
+        size = sum(f["bytes"] for f in s["files"].values()) / 1024 / 1024
+        st.caption(f"🗂️ {s['name']} · {size:,.1f} MB · integrity {s['integrity']}")
+    if not snapshots:
+        st.caption("Chưa có bản sao lưu nào")
 
 st.markdown("""
 ---
@@ -0,0 +1,6 @@
+"""Sinh dữ liệu giả lập và đo thời gian các đường xử lý nóng của từng trang.
+
+Chạy từ thư mục gốc của repo:
+
+    python -m benchmarks.run --sizes 1000 10000 100000
+"""
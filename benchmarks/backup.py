@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from sqlalchemy.orm import sessionmaker
+
+import models
+from benchmarks.run import RESULTS_DIR, build_database, git_commit
+from benchmarks.loadtest import OPERATIONS, classify, percentile
+from services import backup
+
+# Ghi có bị chậm / bị khoá khi đang sao lưu DB lớn không: vài thread ghi liên
+# tục bằng đúng các thao tác sửa của trang (thanh toán, tick todo, thêm giao
+# dịch), đo độ trễ khi chạy một mình rồi trong lúc services.backup.snapshot()
+# copy DB. Sau đó khôi phục snapshot vào file mới và kiểm tra integrity.
+# Trả về 1 nếu có lần ghi lỗi / bị khoá hoặc p99 lúc backup vượt --max-p99-ms.
+
+
+class Writers:
+    def __init__(self, factory, n, count, interval, seed):
+        self.factory = factory
+        self.n = n
+        self.count = count
+        self.interval = interval
+        self.seed = seed
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.samples = []   # (thời điểm bắt đầu, giây, kết quả)
+        self.threads = []
+
+    def run(self, writer):
+        rng = random.Random(self.seed * 1000 + writer)
+        ops = list(OPERATIONS["edit"].values())
+        while not self.stop.is_set():
+            session = self.factory()
+            start = time.perf_counter()
+            try:
+                rng.choice(ops)(session, rng, self.n)
+                outcome = "ok"
+            except Exception as e:
+                session.rollback()
+                outcome = classify(e)
+            finally:
+                session.close()
+            with self.lock:
+                self.samples.append((start, time.perf_counter() - start, outcome))
+            time.sleep(self.interval)
+
+    def start(self):
+        self.threads = [
+            threading.Thread(target=self.run, args=(w,), daemon=True)
+            for w in range(self.count)
+        ]
+        for t in self.threads:
+            t.start()
+
+    def join(self):
+        self.stop.set()
+        for t in self.threads:
+            t.join()
+
+    def window(self, begin, end):
+        with self.lock:
+            samples = [s for s in self.samples if begin <= s[0] < end]
+        latencies = [s[1] for s in samples if s[2] == "ok"]
+        row = {
+            "writes": len(latencies),
+            "locked": sum(s[2] == "locked" for s in samples),
+            "error": sum(s[2] not in ("ok", "locked") for s in samples),
+            "writes_per_s": len(latencies) / (end - begin) if end > begin else 0,
+        }
+        if latencies:
+            row.update({
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "max_ms": max(latencies) * 1000,
+            })
+        return row
+
+
+def print_window(name, row):
+    times = (
+        "".join(f" {row[k]:>8.1f}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms"))
+        if row["writes"] else " " * 36
+    )
+    print(f"{name:<16} {row['writes']:>7} {row['writes_per_s']:>8.1f}{times} "
+          f"{row['locked']:>7} {row['error']:>5}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Độ trễ ghi trong lúc sao lưu trực tuyến")
+    parser.add_argument("--rows", type=int, default=200_000, help="Kích thước DB giả lập")
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--interval", type=float, default=5, help="Nghỉ giữa hai lần ghi (ms)")
+    parser.add_argument("--baseline", type=float, default=3, help="Giây đo khi chưa backup")
+    parser.add_argument("--pages", type=int, default=backup.PAGES)
+    parser.add_argument("--pause", type=float, default=backup.PAUSE * 1000,
+                        help="Nghỉ giữa hai lô trang (ms)")
+    parser.add_argument("--max-p99-ms", type=float, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="File JSON kết quả (mặc định benchmarks/results/)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "backup.db")
+        print(f"Tạo DB giả lập {args.rows:,} dòng...", flush=True)
+        engine, _, _ = build_database(path, args.rows, args.seed)
+        engine.dispose()
+        backup.ensure_wal(path)
+        size_mb = sum(
+            os.path.getsize(p) for p in (path, models.archive_path(path)) if os.path.exists(p)
+        ) / 1024 / 1024
+
+        engine = models.create_app_engine(path)
+        writers = Writers(
+            sessionmaker(bind=engine), args.rows, args.writers, args.interval / 1000, args.seed
+        )
+        writers.start()
+
+        t0 = time.perf_counter()
+        time.sleep(args.baseline)
+        t1 = time.perf_counter()
+        folder = backup.snapshot(
+            path, os.path.join(tmpdir, "backups"), pages=args.pages, pause=args.pause / 1000
+        )
+        t2 = time.perf_counter()
+        writers.join()
+        engine.dispose()
+
+        baseline = writers.window(t0, t1)
+        during = writers.window(t1, t2)
+
+        restored = os.path.join(tmpdir, "restored.db")
+        backup.restore(folder, restored)
+        integrity = backup.integrity_check(restored)
+        manifest = backup.read_manifest(folder)
+
+    print(f"\nDB {size_mb:,.1f} MB · backup {t2 - t1:.2f} s "
+          f"({args.pages} trang / lô, nghỉ {args.pause:g} ms) · "
+          f"khôi phục + integrity_check: {'; '.join(integrity[:3])}\n")
+    print(f"{'':<16} {'ghi':>7} {'ghi/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} "
+          f"{'locked':>7} {'lỗi':>5}")
+    print_window("không backup", baseline)
+    print_window("đang backup", during)
+
+    failed = (
+        integrity != ["ok"]
+        or during["locked"] or during["error"] or baseline["error"]
+        or not during["writes"]
+        or during["p99_ms"] > args.max_p99_ms
+    )
+    print("\n" + ("❌ Không đạt" if failed else "✅ Đạt") +
+          f" (p99 khi backup <= {args.max_p99_ms:g} ms, không lỗi / khoá)")
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "rows": args.rows,
+        "db_mb": size_mb,
+        "writers": args.writers,
+        "interval_ms": args.interval,
+        "pages": args.pages,
+        "pause_ms": args.pause,
+        "backup_s": t2 - t1,
+        "snapshot": manifest,
+        "restore_integrity": integrity,
+        "baseline": baseline,
+        "during_backup": during,
+        "passed": not failed,
+    }
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"backup-{datetime.now():%Y%m%d-%H%M%S}-{commit}.json"
+    )
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Đã lưu kết quả: {out}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
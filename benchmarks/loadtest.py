@@ -0,0 +1,339 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, exc
+from sqlalchemy.orm import sessionmaker
+
+import models
+import search
+from benchmarks import synthetic
+from benchmarks.run import RESULTS_DIR, build_database, git_commit
+from services.invoices import InvoiceRepository, SUMMARY_COLUMNS, parse_frame
+from services.documents import DocumentRepository
+from services.todos import TodoRepository
+from services.finance import TransactionRepository, TYPES
+
+# Nhiều người dùng cùng lúc trên một file SQLite: mỗi user là một thread (như
+# mỗi session Streamlit trong cùng process), dùng chung engine của app và chạy
+# đúng các lời gọi repository mà trang thực hiện. Đo độ trễ theo thao tác,
+# throughput và số lỗi khoá ("database is locked") / hết connection trong pool.
+
+# Tỉ lệ mặc định theo loại thao tác
+MIXES = {
+    "read-heavy": {"read": 0.90, "edit": 0.09, "import": 0.01},
+    "balanced": {"read": 0.60, "edit": 0.35, "import": 0.05},
+    "write-heavy": {"read": 0.30, "edit": 0.60, "import": 0.10},
+}
+SEARCH_TERMS = ["sua", "duong", "bao cao", "an uong", "hoa phat", "gao st25"]
+
+
+# OPERATIONS
+# Mỗi thao tác nhận (session, rng, n) và tự commit nếu ghi
+def read_invoice_summary(session, rng, n):
+    InvoiceRepository(session).summary_page(
+        rng.choice(SUMMARY_COLUMNS), rng.random() < 0.5,
+        limit=50, offset=rng.randrange(5) * 50
+    )
+
+
+def read_invoice_dashboard(session, rng, n):
+    repo = InvoiceRepository(session)
+    repo.totals()
+    repo.debt_by_supplier()
+    repo.monthly_totals()
+
+
+def read_aging(session, rng, n):
+    InvoiceRepository(session).aging_report(limit=50)
+
+
+def read_reminder(session, rng, n):
+    DocumentRepository(session).summary_page(limit=50)
+
+
+def read_finance_series(session, rng, n):
+    TransactionRepository(session).series(period="week")
+
+
+def read_search(session, rng, n):
+    search.search(session, rng.choice(SEARCH_TERMS), limit=100)
+
+
+def edit_payment(session, rng, n):
+    repo = InvoiceRepository(session)
+    invoice = session.get(models.Invoice, rng.randint(1, n))
+    if invoice is not None and invoice.total_debt > 0:
+        repo.add_payment(invoice, min(1000, invoice.total_debt))
+        session.commit()
+
+
+def edit_todo(session, rng, n):
+    repo = TodoRepository(session)
+    todo = repo.get(rng.randint(1, n))
+    if todo is not None:
+        repo.set_done(todo, not todo.is_done)
+        session.commit()
+
+
+def edit_transaction(session, rng, n):
+    TransactionRepository(session).add(
+        rng.randint(1, 500) * 1000, rng.choice(TYPES), "Kiểm thử tải",
+        date.today() - timedelta(days=rng.randrange(365))
+    )
+    session.commit()
+
+
+def import_invoices(session, rng, n, size=200):
+    # Như nút "Xử lý hoá đơn": đọc + kiểm tra rồi upsert trong một transaction
+    rows, _ = parse_frame(synthetic.import_frame(size, seed=rng.randrange(1_000_000)))
+    InvoiceRepository(session).upsert_rows(rows)
+    session.commit()
+
+
+OPERATIONS = {
+    "read": {
+        "invoice.summary": read_invoice_summary,
+        "invoice.dashboard": read_invoice_dashboard,
+        "invoice.aging": read_aging,
+        "reminder.summary": read_reminder,
+        "finance.series": read_finance_series,
+        "search": read_search,
+    },
+    "edit": {
+        "invoice.payment": edit_payment,
+        "todo.toggle": edit_todo,
+        "finance.add": edit_transaction,
+    },
+    "import": {
+        "invoice.import": import_invoices,
+    },
+}
+
+
+# RUNNER
+def classify(error):
+    if isinstance(error, exc.TimeoutError):
+        return "pool_timeout"
+    message = str(error).lower()
+    if isinstance(error, exc.OperationalError) and ("locked" in message or "busy" in message):
+        return "locked"
+    return "error"
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.failures = {}
+
+    def add(self, name, seconds, outcome):
+        with self.lock:
+            if outcome == "ok":
+                self.latencies.setdefault(name, []).append(seconds)
+            else:
+                counts = self.failures.setdefault(name, {})
+                counts[outcome] = counts.get(outcome, 0) + 1
+
+
+def run_user(user, factory, n, mix, args, recorder, deadline):
+    rng = random.Random(args.seed * 1000 + user)
+    kinds, weights = zip(*mix.items())
+    while time.perf_counter() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        name, op = rng.choice(list(OPERATIONS[kind].items()))
+        name = f"{kind}.{name}"
+
+        session = factory()
+        start = time.perf_counter()
+        try:
+            op(session, rng, n)
+            outcome = "ok"
+        except Exception as e:
+            session.rollback()
+            outcome = classify(e)
+            if outcome == "error" and args.verbose:
+                print(f"user {user} {name}: {e!r}", file=sys.stderr)
+        finally:
+            session.close()
+        recorder.add(name, time.perf_counter() - start, outcome)
+
+        if args.think:
+            time.sleep(rng.uniform(0, 2 * args.think / 1000))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(recorder, elapsed):
+    results = []
+    for name in sorted(set(recorder.latencies) | set(recorder.failures)):
+        latencies = recorder.latencies.get(name, [])
+        failures = recorder.failures.get(name, {})
+        row = {
+            "op": name,
+            "ok": len(latencies),
+            "locked": failures.get("locked", 0),
+            "pool_timeout": failures.get("pool_timeout", 0),
+            "error": failures.get("error", 0),
+        }
+        if latencies:
+            row.update({
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "max_ms": max(latencies) * 1000,
+                "mean_ms": statistics.fmean(latencies) * 1000,
+            })
+        results.append(row)
+
+    total_ok = sum(r["ok"] for r in results)
+    return results, {
+        "elapsed_s": elapsed,
+        "ops": total_ok,
+        "throughput_ops_s": total_ok / elapsed if elapsed else 0,
+        "locked": sum(r["locked"] for r in results),
+        "pool_timeout": sum(r["pool_timeout"] for r in results),
+        "error": sum(r["error"] for r in results),
+    }
+
+
+def print_report(results, totals):
+    print(f"{'thao tác':<24} {'ok':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} "
+          f"{'locked':>7} {'pool':>5} {'lỗi':>5}")
+    for r in results:
+        times = (
+            "".join(f" {r[k]:>8.1f}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms"))
+            if r["ok"] else " " + " " * 35
+        )
+        print(f"{r['op']:<24} {r['ok']:>7}{times} {r['locked']:>7} "
+              f"{r['pool_timeout']:>5} {r['error']:>5}")
+    print(f"\n{totals['ops']} thao tác trong {totals['elapsed_s']:.1f} s "
+          f"= {totals['throughput_ops_s']:.1f} ops/s · locked {totals['locked']} · "
+          f"hết pool {totals['pool_timeout']} · lỗi khác {totals['error']}")
+
+
+def prepare_database(args, tmpdir):
+    """Đường dẫn DB dùng cho lần chạy: bản sao của --db, hoặc DB giả lập mới"""
+    path = os.path.join(tmpdir, "loadtest.db")
+    if args.db:
+        # Sao chép bằng backup API để không đụng vào DB thật đang chạy
+        with sqlite3.connect(args.db) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+        archive = models.archive_path(args.db)
+        if os.path.exists(archive):
+            shutil.copyfile(archive, models.archive_path(path))
+        engine = models.create_app_engine(path)
+        models.init_db(engine)
+        with engine.connect() as conn:
+            n = conn.exec_driver_sql("SELECT max(invoice_id) FROM invoices").scalar() or 1
+    else:
+        engine, _, _ = build_database(path, args.rows, args.seed)
+        n = args.rows
+    engine.dispose()
+
+    if args.journal:
+        with sqlite3.connect(path) as conn:
+            conn.execute(f"PRAGMA journal_mode = {args.journal}")
+    return path, n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm thử tải nhiều người dùng trên SQLite")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16],
+                        help="Số người dùng đồng thời; mỗi giá trị là một lượt chạy")
+    parser.add_argument("--duration", type=float, default=20, help="Giây cho mỗi lượt")
+    parser.add_argument("--mix", choices=list(MIXES), default="read-heavy")
+    parser.add_argument("--read", type=float, help="Ghi đè tỉ lệ đọc của --mix")
+    parser.add_argument("--edit", type=float, help="Ghi đè tỉ lệ sửa của --mix")
+    parser.add_argument("--import", dest="import_", type=float, help="Ghi đè tỉ lệ import của --mix")
+    parser.add_argument("--rows", type=int, default=10_000, help="Kích thước DB giả lập")
+    parser.add_argument("--db", help="Chạy trên bản sao của file DB này thay cho DB giả lập")
+    parser.add_argument("--journal", choices=["delete", "wal"],
+                        help="Đặt journal_mode cho DB kiểm thử")
+    parser.add_argument("--busy-timeout", type=int,
+                        help="PRAGMA busy_timeout (ms) cho mỗi connection")
+    parser.add_argument("--think", type=float, default=0,
+                        help="Thời gian nghỉ trung bình giữa hai thao tác (ms)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="File JSON kết quả (mặc định benchmarks/results/)")
+    parser.add_argument("--verbose", action="store_true", help="In lỗi không phải lỗi khoá")
+    args = parser.parse_args(argv)
+
+    mix = dict(MIXES[args.mix])
+    for kind, value in (("read", args.read), ("edit", args.edit), ("import", args.import_)):
+        if value is not None:
+            mix[kind] = value
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path, n = prepare_database(args, tmpdir)
+        for users in args.users:
+            engine = models.create_app_engine(path)
+            if args.busy_timeout is not None:
+                event.listen(
+                    engine, "connect",
+                    lambda conn, record: conn.execute(f"PRAGMA busy_timeout = {args.busy_timeout}")
+                )
+            factory = sessionmaker(bind=engine)
+            recorder = Recorder()
+
+            print(f"\n== {users} người dùng · {args.mix} {mix} · {args.duration:.0f} s ==", flush=True)
+            start = time.perf_counter()
+            deadline = start + args.duration
+            threads = [
+                threading.Thread(
+                    target=run_user,
+                    args=(u, factory, n, mix, args, recorder, deadline),
+                    daemon=True
+                )
+                for u in range(users)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+            engine.dispose()
+
+            results, totals = summarize(recorder, elapsed)
+            print_report(results, totals)
+            runs.append({"users": users, "totals": totals, "results": results})
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "rows": n,
+        "mix": mix,
+        "duration_s": args.duration,
+        "journal": args.journal,
+        "busy_timeout_ms": args.busy_timeout,
+        "think_ms": args.think,
+        "runs": runs,
+    }
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"loadtest-{datetime.now():%Y%m%d-%H%M%S}-{commit}.json"
+    )
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Đã lưu kết quả: {out}")
+    return 1 if any(r["totals"]["error"] for r in runs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
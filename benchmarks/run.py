@@ -0,0 +1,318 @@
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+from sqlalchemy.orm import sessionmaker
+
+import models
+import search
+from benchmarks import synthetic
+from services.invoices import InvoiceRepository, export_frame
+from services.importer import parse_workbooks
+from services.documents import DocumentRepository
+from services.todos import TodoRepository
+from services.downsample import downsample
+from services.finance import (
+    TransactionRepository, add_period_columns, monthly_summary,
+    yearly_summary, build_financial_context
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+PAGES_DIR = os.path.join(models.BASE_DIR, "pages")
+
+
+# CASES
+# Mỗi case nhận (Session, n) và chạy đúng những gì trang làm mỗi lần rerun
+def invoice_load(session, n):
+    return InvoiceRepository(session).list_with_parties()
+
+
+def invoice_aggregate(session, n):
+    repo = InvoiceRepository(session)
+    repo.totals()
+    repo.debt_by_supplier()
+    repo.monthly_totals()
+
+
+def invoice_summary(session, n):
+    InvoiceRepository(session).summary_page("Còn nợ", True, limit=50)
+
+
+def invoice_aging(session, n):
+    InvoiceRepository(session).aging_report(limit=50, offset=0)
+
+
+def invoice_payment(session, n):
+    # Một khoản thanh toán: trigger chỉ sửa một hoá đơn và một dòng số dư
+    repo = InvoiceRepository(session)
+    invoice = session.query(models.Invoice).filter(models.Invoice.total_debt > 0).first()
+    repo.add_payment(invoice, 1000)
+    repo.debt_by_supplier()
+    session.rollback()
+
+
+def invoice_export(session, n, export_rows):
+    data = InvoiceRepository(session).list_with_parties()[:export_rows]
+    export_frame(data).to_excel(io.BytesIO(), index=False)
+
+
+def invoice_import(session, n, frame):
+    errors = InvoiceRepository(session).import_frame(frame)
+    session.rollback()
+    return errors
+
+
+def invoice_parse_files(session, n, files):
+    parse_workbooks(files)
+
+
+def reminder_list(session, n):
+    repo = DocumentRepository(session)
+    repo.upcoming(10)
+    repo.count()
+
+
+def reminder_summary(session, n):
+    # Trang đầu, sắp xếp theo tên (không có index) để đo trường hợp xấu
+    DocumentRepository(session).summary_page("Tên văn bản", limit=50)
+
+
+def todo_for_date(session, n):
+    TodoRepository(session).for_date(date.today())
+
+
+def finance_load(session, n):
+    repo = TransactionRepository(session)
+    repo.count()
+    repo.recent(10)
+    return add_period_columns(repo.fetch_data())
+
+
+def finance_aggregate(session, n):
+    df = finance_load(session, n)
+    monthly_summary(df)
+    yearly_summary(df)
+    build_financial_context(df)
+
+
+def finance_summary(session, n):
+    TransactionRepository(session).summary_page("Số tiền", True, query="an", limit=50)
+
+
+def finance_series(session, n):
+    # Chuỗi theo ngày toàn bộ lịch sử, giảm còn 1.500 điểm như trang Finance
+    series = TransactionRepository(session).series(period="day")
+    for col in ("Thu", "Chi"):
+        downsample(series["Ngày"], series[col], 1500)
+
+
+def finance_export(session, n, export_rows):
+    df = finance_load(session, n).head(export_rows)
+    df.drop(columns=["Ngày", "Tháng", "Năm", "Thu", "Chi"]).to_excel(
+        io.BytesIO(), index=False
+    )
+
+
+def search_queries(session, n):
+    for q in ["sua", "duong tinh", "bao cao", "an uong", "hoa phat 12"]:
+        search.search(session, q, limit=20)
+
+
+# TIMING
+def measure(fn, repeat):
+    """Thời gian (không bật tracemalloc) rồi một lần chạy riêng để đo peak bộ nhớ"""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+def run_apptest(page):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    at = AppTest.from_file(os.path.join(PAGES_DIR, page), default_timeout=600)
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+
+def build_database(path, n, seed):
+    engine = models.create_app_engine(path)
+    models.init_db(engine)
+    factory = sessionmaker(bind=engine)
+
+    start = time.perf_counter()
+    with models.session_scope(factory) as session:
+        synthetic.generate(session, n, seed=seed)
+    return engine, factory, time.perf_counter() - start
+
+
+def run_size(n, args, tmpdir):
+    path = os.path.join(tmpdir, f"bench_{n}.db")
+    engine, factory, generate_s = build_database(path, n, args.seed)
+    results = [{"case": "setup.generate", "rows": n, "min_s": generate_s,
+                "median_s": generate_s, "peak_mb": None}]
+
+    frame = synthetic.import_frame(min(n, args.import_rows), seed=args.seed)
+    files = []
+    for k in range(args.import_files):
+        buffer = io.BytesIO()
+        synthetic.import_frame(min(n, args.import_rows), seed=args.seed + k).to_excel(
+            buffer, index=False
+        )
+        files.append((f"ncc_{k}.xlsx", buffer.getvalue()))
+    cases = {
+        "invoice.load": invoice_load,
+        "invoice.aggregate": invoice_aggregate,
+        "invoice.summary": invoice_summary,
+        "invoice.aging": invoice_aging,
+        "invoice.payment": invoice_payment,
+        "invoice.import": lambda s, n: invoice_import(s, n, frame),
+        "invoice.parse_files": lambda s, n: invoice_parse_files(s, n, files),
+        "invoice.export": lambda s, n: invoice_export(s, n, args.export_rows),
+        "reminder.list": reminder_list,
+        "reminder.summary": reminder_summary,
+        "todo.for_date": todo_for_date,
+        "finance.load": finance_load,
+        "finance.aggregate": finance_aggregate,
+        "finance.summary": finance_summary,
+        "finance.series": finance_series,
+        "finance.export": lambda s, n: finance_export(s, n, args.export_rows),
+        "search.queries": search_queries,
+    }
+
+    for name, case in cases.items():
+        if args.only and not any(name.startswith(p) for p in args.only):
+            continue
+
+        def call():
+            session = factory()
+            try:
+                case(session, n)
+            finally:
+                session.close()
+
+        stats = measure(call, args.repeat)
+        results.append({"case": name, "rows": n, **stats})
+        print(f"{n:>9} {name:<20} {stats['median_s'] * 1000:>10.1f} ms "
+              f"{stats['peak_mb']:>8.1f} MB", flush=True)
+
+    if args.apptest and n <= args.apptest:
+        # Chạy nguyên script trang qua AppTest trên DB giả lập
+        models.engine = engine
+        models.SessionLocal.configure(bind=engine)
+        for page in ["Invoice.py", "Reminder.py", "Todo.py", "Finance.py"]:
+            stats = measure(lambda: run_apptest(page), args.repeat)
+            name = f"page.{page[:-3].lower()}"
+            results.append({"case": name, "rows": n, **stats})
+            print(f"{n:>9} {name:<20} {stats['median_s'] * 1000:>10.1f} ms "
+                  f"{stats['peak_mb']:>8.1f} MB", flush=True)
+
+    engine.dispose()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=models.BASE_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(base_path, new_path, threshold):
+    """In tỉ lệ thời gian new/base theo từng case, trả về số case chậm đi"""
+    with open(base_path, encoding="utf-8") as f:
+        base = {(r["case"], r["rows"]): r for r in json.load(f)["results"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)["results"]
+
+    regressions = 0
+    for r in new:
+        old = base.get((r["case"], r["rows"]))
+        if not old or not old["median_s"]:
+            continue
+        ratio = r["median_s"] / old["median_s"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  ⚠️ chậm hơn"
+            regressions += 1
+        print(f"{r['rows']:>9} {r['case']:<20} {old['median_s'] * 1000:>10.1f} -> "
+              f"{r['median_s'] * 1000:>10.1f} ms  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các trang trên dữ liệu giả lập")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="Chỉ chạy case có tiền tố này (vd. invoice finance.load)")
+    parser.add_argument("--import-rows", type=int, default=2_000)
+    parser.add_argument("--import-files", type=int, default=4,
+                        help="Số workbook cho case invoice.parse_files (đọc song song)")
+    parser.add_argument("--export-rows", type=int, default=100_000)
+    parser.add_argument("--apptest", type=int, default=0,
+                        help="Chạy cả script trang qua AppTest với các size <= giá trị này")
+    parser.add_argument("--out", help="File JSON kết quả (mặc định benchmarks/results/)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"))
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in args.sizes:
+            results.extend(run_size(n, args, tmpdir))
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": args.sizes,
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json"
+    )
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Đã lưu kết quả: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import random
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert
+from models import (
+    Supplier, Product, Invoice, Payment, Department, Document,
+    Todo, Personal_Spending, ChatHistory
+)
+
+CHUNK = 50_000
+
+SUPPLIER_PREFIXES = ["Công ty", "Cửa hàng", "Đại lý", "Nhà phân phối", "HTX"]
+SUPPLIER_WORDS = [
+    "Hoà Phát", "Minh Long", "Đại Việt", "Sài Gòn", "Hà Nội", "Thành Công",
+    "Phú Quý", "An Khang", "Bình Minh", "Tân Tiến", "Hưng Thịnh", "Kim Ngân",
+]
+PRODUCTS = [
+    "Gạo ST25", "Đường tinh luyện", "Sữa tươi", "Dầu ăn", "Nước mắm",
+    "Bột mì", "Cà phê rang", "Trà xanh", "Muối i-ốt", "Giấy in A4",
+    "Mực in", "Bánh quy", "Nước suối", "Xi măng", "Thép cuộn",
+]
+DEPARTMENTS = [
+    "Hành chính", "Kế toán", "Nhân sự", "Kinh doanh", "Kỹ thuật",
+    "Pháp chế", "Mua hàng", "Kho vận", "Marketing", "Ban giám đốc",
+]
+DOC_KINDS = ["Báo cáo", "Tờ trình", "Công văn", "Hợp đồng", "Biên bản", "Quyết định"]
+TASKS = [
+    "Gửi báo cáo", "Gọi nhà cung cấp", "Duyệt hoá đơn", "Họp phòng",
+    "Kiểm kho", "Đối chiếu công nợ", "Cập nhật hợp đồng", "Soạn công văn",
+]
+INCOME_CATEGORIES = ["Lương", "Thưởng", "Bán hàng", "Lãi tiết kiệm"]
+EXPENSE_CATEGORIES = [
+    "Ăn uống", "Đi lại", "Nhà ở", "Điện nước", "Mua sắm",
+    "Giải trí", "Y tế", "Giáo dục",
+]
+STATUSES = ["Đang xử lý", "Hoàn thành", "Tạm dừng"]
+
+
+def _insert(session, model, rows):
+    for start in range(0, len(rows), CHUNK):
+        session.execute(insert(model), rows[start:start + CHUNK])
+
+
+def generate(session, n, seed=0, years=5):
+    """Sinh khoảng n dòng cho mỗi bảng lớn (hoá đơn, văn bản, task, giao dịch)"""
+    rng = random.Random(seed)
+    today = date.today()
+    start = today - timedelta(days=365 * years)
+    span = (today - start).days
+
+    def rand_date():
+        return start + timedelta(days=rng.randrange(span))
+
+    # Nhà cung cấp / sản phẩm
+    n_suppliers = max(10, n // 1000)
+    suppliers = [{
+        "supplier_id": i,
+        "supplier_name": f"{rng.choice(SUPPLIER_PREFIXES)} {rng.choice(SUPPLIER_WORDS)} {i}",
+    } for i in range(1, n_suppliers + 1)]
+    _insert(session, Supplier, suppliers)
+
+    # Mỗi (sản phẩm, tháng) chỉ có một hoá đơn (khoá tự nhiên) nên cần đủ
+    # sản phẩm để n hoá đơn trải trên khoảng years * 12 tháng
+    n_products = max(20, n // 20)
+    products = [{
+        "product_id": i,
+        "product_name": f"{rng.choice(PRODUCTS)} #{i}",
+        "supplier_id": rng.randint(1, n_suppliers),
+    } for i in range(1, n_products + 1)]
+    _insert(session, Product, products)
+
+    first = start.year * 12 + start.month - 1
+    months = [
+        date(m // 12, m % 12 + 1, 1)
+        for m in range(first, today.year * 12 + today.month)
+    ]
+    keys = rng.sample(range(n_products * len(months)), min(n, n_products * len(months)))
+
+    # Hoá đơn tạo với total_paid = 0; số đã trả đi qua payments để trigger
+    # ledger cập nhật hoá đơn và số dư NCC như khi dùng thật
+    invoices, payments = [], []
+    for invoice_id, key in enumerate(keys, start=1):
+        product = products[key // len(months)]
+        month = months[key % len(months)]
+        price = rng.randint(1, 500) * 1000
+        quantity = rng.randint(1, 200)
+        total = price * quantity
+        invoices.append({
+            "invoice_id": invoice_id,
+            "supplier_id": product["supplier_id"],
+            "product_id": product["product_id"],
+            "invoice_month": month,
+            "price": price,
+            "quantity": quantity,
+            "total_amount": total,
+            "total_paid": 0,
+            "total_debt": total,
+        })
+        paid = rng.choice([0, total, total, rng.randint(0, total // 1000) * 1000])
+        # Trả đủ thường chia làm hai lần
+        parts = [paid // 2, paid - paid // 2] if paid == total and rng.random() < 0.5 else [paid]
+        for amount in parts:
+            if amount:
+                payments.append({
+                    "invoice_id": invoice_id,
+                    "payment_date": min(month + timedelta(days=rng.randrange(90)), today),
+                    "amount": amount,
+                })
+    _insert(session, Invoice, invoices)
+    _insert(session, Payment, payments)
+
+    # Phòng ban / văn bản
+    _insert(session, Department, [
+        {"department_id": i, "department_name": name}
+        for i, name in enumerate(DEPARTMENTS, start=1)
+    ])
+    _insert(session, Document, [{
+        "document_name": f"{rng.choice(DOC_KINDS)} số {i}",
+        "department_id": rng.randint(1, len(DEPARTMENTS)),
+        "deadline": today + timedelta(days=rng.randint(-180, 180)),
+        "status": rng.choice(STATUSES),
+    } for i in range(1, n + 1)])
+
+    # Todo
+    _insert(session, Todo, [{
+        "task": f"{rng.choice(TASKS)} {i}",
+        "due_date": today + timedelta(days=rng.randint(-30, 30)),
+        "is_done": rng.random() < 0.5,
+    } for i in range(1, n + 1)])
+
+    # Thu chi
+    transactions = []
+    for _ in range(n):
+        if rng.random() < 0.2:
+            type_, category = "Thu nhập", rng.choice(INCOME_CATEGORIES)
+            amount = rng.randint(100, 5000) * 10_000
+        else:
+            type_, category = "Chi tiêu", rng.choice(EXPENSE_CATEGORIES)
+            amount = rng.randint(1, 2000) * 1000
+        transactions.append({
+            "amount": amount,
+            "type": type_,
+            "category": category,
+            "transaction_date": rand_date(),
+        })
+    _insert(session, Personal_Spending, transactions)
+
+    # Lịch sử hỏi đáp
+    _insert(session, ChatHistory, [{
+        "question": f"Tháng này tôi chi cho {rng.choice(EXPENSE_CATEGORIES)} bao nhiêu?",
+        "answer": f"Bạn nên giảm chi {rng.choice(EXPENSE_CATEGORIES)} khoảng {rng.randint(5, 30)}%.",
+        "created_at": datetime.combine(rand_date(), datetime.min.time()),
+    } for _ in range(max(10, n // 100))])
+
+
+def import_frame(n, seed=0):
+    """DataFrame giống file Excel mẫu để đo đường import"""
+    import pandas as pd
+
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        price = rng.randint(1, 500) * 1000
+        quantity = rng.randint(1, 200)
+        rows.append({
+            "Nhà cung cấp": f"{rng.choice(SUPPLIER_PREFIXES)} {rng.choice(SUPPLIER_WORDS)}",
+            "Sản phẩm": rng.choice(PRODUCTS),
+            "Tháng": f"{rng.randint(2020, 2025)}-{rng.randint(1, 12):02d}",
+            "Giá": price,
+            "Số lượng": quantity,
+            "Đã trả": rng.choice([0, price * quantity]),
+        })
+    return pd.DataFrame(rows)
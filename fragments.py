@@ -0,0 +1,84 @@
+import streamlit as st
+
+# Chạy lại từng vùng của trang bằng st.fragment thay cho cả script.
+#
+# - Mỗi dòng trong danh sách (hoá đơn, giao dịch, văn bản, task) là một
+#   fragment: sửa / thanh toán / đánh dấu xong chỉ chạy lại đúng dòng đó.
+# - View tổng hợp (bảng, KPI, biểu đồ) là fragment riêng để lọc / sắp xếp /
+#   chọn trang không chạy lại cả trang; kết quả truy vấn được lưu trong
+#   session_state theo (view, tham số).
+# - Streamlit không cho một fragment chạy lại fragment khác, nên thao tác ghi
+#   gọi refresh(): đánh dấu cũ các view bị ảnh hưởng rồi chạy lại cả trang
+#   một lần. Lần chạy đó giữ kết quả đã lưu, chỉ view bị đánh dấu mới truy
+#   vấn lại. Các lần chạy toàn trang khác xoá hết để thấy thay đổi của người
+#   khác.
+# - Thay đổi cấu trúc danh sách (thêm / xoá dòng) vẫn chạy lại cả trang.
+
+_CACHE = "_fragment_cache"
+_NOTICES = "_fragment_notices"
+_KEEP = "_fragment_keep"
+_RERUN = "_fragment_rerun"
+
+
+def _cache():
+    return st.session_state.setdefault(_CACHE, {})
+
+
+def start_page():
+    """Gọi ở đầu mỗi lần chạy toàn trang"""
+    st.session_state.pop(_RERUN, None)
+    if not st.session_state.pop(_KEEP, False):
+        # Dữ liệu có thể đã đổi bởi người khác
+        _cache().clear()
+
+
+def cached(view, params, load):
+    """Kết quả load() cho (view, params), chỉ gọi lại khi view bị invalidate"""
+    cache = _cache()
+    key = (view, params)
+    if key not in cache:
+        cache[key] = load()
+    return cache[key]
+
+
+def invalidate(*views):
+    cache = _cache()
+    for key in [k for k in cache if k[0] in views]:
+        del cache[key]
+
+
+def refresh(*views):
+    """Sau khi ghi (thường trong on_click): đánh dấu cũ các view rồi yêu cầu
+    chạy lại cả trang một lần, giữ nguyên các view khác"""
+    invalidate(*views)
+    st.session_state[_KEEP] = True
+    st.session_state[_RERUN] = True
+
+
+def rerun_if_refreshed():
+    """Đầu thân fragment của dòng: callback vừa gọi refresh() thì chạy lại cả
+    trang (callback không được gọi st.rerun)"""
+    if st.session_state.pop(_RERUN, False):
+        st.rerun()
+
+
+def row_state(view, row_id, initial):
+    """Bản mới nhất của một dòng: initial lấy từ lần chạy toàn trang, sau khi
+    fragment của dòng ghi DB thì dùng bản đã đọc lại (set_row_state)"""
+    return _cache().get((view, row_id), initial)
+
+
+def set_row_state(view, row_id, value):
+    _cache()[(view, row_id)] = value
+
+
+# Callback (on_click) không được vẽ element khi fragment chạy lại: ghi
+# thông báo ở đây rồi hiện trong thân fragment bằng show_notice()
+def notify(view, row_id, message):
+    st.session_state.setdefault(_NOTICES, {})[(view, row_id)] = message
+
+
+def show_notice(view, row_id):
+    message = st.session_state.get(_NOTICES, {}).pop((view, row_id), None)
+    if message:
+        st.toast(message)
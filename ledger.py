@@ -0,0 +1,94 @@
+from sqlalchemy import text
+
+# Số dư công nợ do SQLite tự duy trì:
+#   payments  -> invoices.total_paid / total_debt (cộng / trừ đúng khoản đó)
+#   invoices  -> supplier_balances.outstanding_debt (cộng phần chênh total_debt)
+# Mỗi thanh toán chỉ sửa một hoá đơn và một dòng số dư, không cộng lại lịch
+# sử; truy vấn công nợ đọc thẳng các cột này.
+
+TRIGGER_PREFIX = "ledger"
+
+
+def _apply_payment(r, sign):
+    return (
+        f"UPDATE invoices SET "
+        f"total_paid = COALESCE(total_paid, 0) {sign} {r}.amount, "
+        f"total_debt = COALESCE(total_debt, 0) {'-' if sign == '+' else '+'} {r}.amount "
+        f"WHERE invoice_id = {r}.invoice_id;"
+    )
+
+
+def _add_balance(supplier, debt):
+    return (
+        "INSERT INTO supplier_balances(supplier_id, outstanding_debt) "
+        f"VALUES ({supplier}, COALESCE({debt}, 0)) "
+        "ON CONFLICT(supplier_id) DO UPDATE "
+        "SET outstanding_debt = outstanding_debt + excluded.outstanding_debt;"
+    )
+
+
+TRIGGERS = {
+    "payments_ai": (
+        f"AFTER INSERT ON payments BEGIN {_apply_payment('NEW', '+')} END"
+    ),
+    "payments_ad": (
+        f"AFTER DELETE ON payments BEGIN {_apply_payment('OLD', '-')} END"
+    ),
+    "payments_au": (
+        "AFTER UPDATE OF amount, invoice_id ON payments BEGIN "
+        f"{_apply_payment('OLD', '-')} {_apply_payment('NEW', '+')} END"
+    ),
+    "invoices_ai": (
+        f"AFTER INSERT ON invoices BEGIN "
+        f"{_add_balance('NEW.supplier_id', 'NEW.total_debt')} END"
+    ),
+    "invoices_ad": (
+        f"AFTER DELETE ON invoices BEGIN "
+        f"{_add_balance('OLD.supplier_id', '-OLD.total_debt')} END"
+    ),
+    "invoices_au": (
+        "AFTER UPDATE OF total_debt, supplier_id ON invoices BEGIN "
+        f"{_add_balance('OLD.supplier_id', '-OLD.total_debt')} "
+        f"{_add_balance('NEW.supplier_id', 'NEW.total_debt')} END"
+    ),
+}
+
+
+def init_ledger(engine):
+    names = [f"{TRIGGER_PREFIX}_{name}" for name in TRIGGERS]
+    with engine.begin() as conn:
+        existing = conn.execute(
+            text(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+                f"AND name IN ({', '.join(repr(n) for n in names)})"
+            )
+        ).scalar()
+        if existing == len(names):
+            return
+
+        # DB cũ hoặc bảng invoices vừa được dựng lại (mất trigger): bỏ hết
+        # trigger rồi đối soát từ đầu để không cộng trùng
+        for name in names:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+
+        # Phần đã trả chưa có trong sổ (nhập trước khi có payments) thành
+        # một khoản "Số dư đầu kỳ"
+        conn.execute(text(
+            "INSERT INTO payments(invoice_id, payment_date, amount, note) "
+            "SELECT i.invoice_id, i.invoice_month, COALESCE(i.total_paid, 0) - COALESCE(p.paid, 0), "
+            "'Số dư đầu kỳ' FROM invoices i LEFT JOIN ("
+            "SELECT invoice_id, SUM(amount) AS paid FROM payments GROUP BY invoice_id"
+            ") p USING (invoice_id) "
+            "WHERE COALESCE(i.total_paid, 0) != COALESCE(p.paid, 0)"
+        ))
+        conn.execute(text("DELETE FROM supplier_balances"))
+        conn.execute(text(
+            "INSERT INTO supplier_balances(supplier_id, outstanding_debt) "
+            "SELECT supplier_id, COALESCE(SUM(total_debt), 0) FROM invoices "
+            "WHERE supplier_id IS NOT NULL GROUP BY supplier_id"
+        ))
+
+        for name, body in TRIGGERS.items():
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {TRIGGER_PREFIX}_{name} {body}"
+            ))
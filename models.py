@@ -1,11 +1,15 @@
 import os
+from contextlib import contextmanager
 from sqlalchemy import (
-    Column, Integer, String, Float, Date, Boolean,
-    ForeignKey, Text, create_engine, DateTime
+    Column, Integer, BigInteger, String, Date, Boolean,
+    ForeignKey, Text, create_engine, DateTime, Table, Index, select, text
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from sqlalchemy import create_engine
-from datetime import datetime
+from sqlalchemy import create_engine, event
+from datetime import datetime, timedelta
+import search
+import analytics
+import ledger
 
 Base = declarative_base()
 
@@ -29,6 +33,20 @@ class Product(Base):
 
 class Invoice(Base):
     __tablename__ = "invoices"
+    # Khoá tự nhiên: mỗi NCC / sản phẩm / tháng chỉ có một hoá đơn
+    __table_args__ = (
+        Index(
+            "uq_invoices_natural_key",
+            "supplier_id", "product_id", "invoice_month",
+            unique=True
+        ),
+        # Báo cáo tuổi nợ chỉ đọc hoá đơn còn nợ: index riêng, phủ đủ cột
+        Index(
+            "ix_invoices_open_debt",
+            "supplier_id", "product_id", "invoice_month", "total_debt",
+            sqlite_where=text("total_debt > 0")
+        ),
+    )
     invoice_id = Column(Integer, primary_key=True)
 
     supplier_id = Column(Integer, ForeignKey("suppliers.supplier_id"))
@@ -36,15 +54,45 @@ class Invoice(Base):
 
     invoice_month = Column(String)
 
-    price = Column(Float)
+    # Tiền: số nguyên đồng
+    price = Column(BigInteger)
     quantity = Column(Integer)
 
-    total_amount = Column(Float)
-    total_paid = Column(Float)
-    total_debt = Column(Float)
+    total_amount = Column(BigInteger)
+    total_paid = Column(BigInteger)
+    total_debt = Column(BigInteger)
 
     supplier = relationship("Supplier")
     product = relationship("Product")
+    payments = relationship(
+        "Payment", back_populates="invoice", cascade="all, delete-orphan"
+    )
+
+# Sổ thanh toán: total_paid / total_debt của hoá đơn và supplier_balances do
+# trigger trong ledger.py cập nhật theo từng khoản, không ghi tay
+class Payment(Base):
+    __tablename__ = "payments"
+    payment_id = Column(Integer, primary_key=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.invoice_id"), index=True)
+    payment_date = Column(Date)
+    amount = Column(BigInteger)
+    note = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    invoice = relationship("Invoice", back_populates="payments")
+
+class SupplierBalance(Base):
+    __tablename__ = "supplier_balances"
+    supplier_id = Column(Integer, ForeignKey("suppliers.supplier_id"), primary_key=True)
+    outstanding_debt = Column(BigInteger, nullable=False, default=0)
+
+class ImportedFile(Base):
+    __tablename__ = "imported_files"
+    file_id = Column(Integer, primary_key=True)
+    content_hash = Column(String, unique=True, nullable=False)
+    file_name = Column(String)
+    row_count = Column(Integer)
+    imported_at = Column(DateTime, default=datetime.utcnow)
 
 
 # ---------- PAGE 2 ----------
@@ -76,10 +124,10 @@ class Todo(Base):
 class Personal_Spending(Base):
     __tablename__ = "transactions"
     transaction_id = Column(Integer, primary_key=True)
-    amount = Column(Float)
+    amount = Column(BigInteger)
     type = Column(String)  
     category = Column(String)
-    transaction_date = Column(Date)
+    transaction_date = Column(Date, index=True)
     monthly_summary = Column(String)
     
 # chatbot
@@ -91,15 +139,237 @@ class ChatHistory(Base):
     answer = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+# ---------- LƯU TRỮ ----------
+# Hoá đơn đã trả đủ và giao dịch của các năm đã đóng được chuyển sang DB
+# archive (ATTACH trên mọi connection), cùng cột với bảng gốc để UNION ALL.
+ARCHIVE_SCHEMA = "archive"
+
+def _archive_table(model):
+    return Table(
+        model.__tablename__, Base.metadata,
+        *[
+            Column(c.name, c.type, primary_key=c.primary_key)
+            for c in model.__table__.columns
+        ],
+        schema=ARCHIVE_SCHEMA
+    )
+
+ArchivedInvoice = _archive_table(Invoice)
+ArchivedTransaction = _archive_table(Personal_Spending)
+# Thanh toán đi cùng hoá đơn của nó
+ArchivedPayment = _archive_table(Payment)
+Index("ix_archive_payments_invoice_id", ArchivedPayment.c.invoice_id)
+# Kiểm tra khoá tự nhiên khi import / thêm tay cũng phải thấy hoá đơn đã lưu trữ
+Index(
+    "ix_archive_invoices_natural_key",
+    ArchivedInvoice.c.supplier_id, ArchivedInvoice.c.product_id, ArchivedInvoice.c.invoice_month
+)
+
+# Bảng đang được services.archive chuyển dở (xem reconcile_archive)
+ArchivePending = Table(
+    "pending_moves", Base.metadata,
+    Column("table_name", String, primary_key=True),
+    Column("started_at", DateTime, nullable=False),
+    schema=ARCHIVE_SCHEMA
+)
+# Dấu mới hơn thế này thuộc lần chuyển có thể vẫn đang chạy
+MOVE_TIMEOUT = timedelta(hours=1)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "database", "app.db")
 
-engine = create_engine(
-    f"sqlite:///{DB_PATH}",
-    connect_args={"check_same_thread": False}
-)
+def archive_path(path):
+    """database/app.db -> database/app_archive.db"""
+    root, ext = os.path.splitext(path)
+    return f"{root}_archive{ext or '.db'}"
+
+
+def create_app_engine(path=DB_PATH):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False}
+    )
+    event.listen(engine, "connect", search.register_functions)
+
+    @event.listens_for(engine, "connect")
+    def attach_archive(dbapi_connection, connection_record):
+        dbapi_connection.execute(
+            f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_path(path),)
+        )
+
+    return engine
+
+engine = create_app_engine()
 
 SessionLocal = sessionmaker(bind=engine)
 
-def init_db():
-    Base.metadata.create_all(engine)
+# Cột tiền trước đây là Float; chuyển sang số nguyên đồng.
+# total_debt tính lại từ hai cột đã làm tròn để luôn = total_amount - total_paid
+_ROUND = 'CAST(ROUND("{}") AS INTEGER)'
+MONEY_COLUMNS = {
+    "invoices": {
+        "price": _ROUND.format("price"),
+        "total_amount": _ROUND.format("total_amount"),
+        "total_paid": _ROUND.format("total_paid"),
+        "total_debt": f'{_ROUND.format("total_amount")} - {_ROUND.format("total_paid")}',
+    },
+    "transactions": {
+        "amount": _ROUND.format("amount"),
+    },
+}
+
+
+def _rebuild_table(conn, table, casts):
+    """Tạo lại bảng theo schema hiện tại, chép dữ liệu qua với biểu thức ép kiểu"""
+    old = f"{table.name}__old"
+    for idx in conn.execute(text(f"PRAGMA index_list('{table.name}')")).mappings():
+        if idx["origin"] == "c":
+            conn.execute(text(f'DROP INDEX "{idx["name"]}"'))
+    # legacy: không sửa khoá ngoại của bảng khác sang trỏ vào bảng __old
+    conn.execute(text("PRAGMA legacy_alter_table = ON"))
+    conn.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{old}"'))
+    conn.execute(text("PRAGMA legacy_alter_table = OFF"))
+    table.create(conn)
+
+    old_columns = {
+        row["name"] for row in conn.execute(text(f"PRAGMA table_info('{old}')")).mappings()
+    }
+    columns = [c.name for c in table.columns if c.name in old_columns]
+    select = [casts.get(c, f'"{c}"') for c in columns]
+    conn.execute(text(
+        f'INSERT INTO "{table.name}" ({", ".join(columns)}) '
+        f'SELECT {", ".join(select)} FROM "{old}"'
+    ))
+    conn.execute(text(f'DROP TABLE "{old}"'))
+
+
+def migrate_money_columns(bind):
+    with bind.begin() as conn:
+        for name, money in MONEY_COLUMNS.items():
+            info = {
+                row["name"]: row["type"].upper()
+                for row in conn.execute(text(f"PRAGMA table_info('{name}')")).mappings()
+            }
+            if not any(info.get(c) in ("FLOAT", "REAL") for c in money):
+                continue
+            _rebuild_table(conn, Base.metadata.tables[name], money)
+
+
+def migrate_invoice_natural_key(bind):
+    """Đưa invoice_month về ngày đầu tháng và gộp hoá đơn trùng khoá tự nhiên
+    trước khi tạo unique index. Trang cũ cho nhập nhiều hoá đơn cùng NCC /
+    sản phẩm / tháng, nên số lượng, tổng tiền và đã trả được cộng vào hoá đơn
+    có id lớn nhất; bản gốc của các dòng bị gộp được giữ trong
+    invoices_duplicates. Nhóm có giá khác nhau (so sau khi làm tròn đồng, như
+    migrate_money_columns) lấy giá bình quân = tổng tiền / tổng số lượng,
+    tổng tiền giữ nguyên tổng cộng."""
+    with bind.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'invoices'"
+        )).first()
+        indexed = conn.execute(text(
+            "SELECT 1 FROM main.sqlite_master WHERE type = 'index' "
+            "AND name = 'uq_invoices_natural_key'"
+        )).first()
+        if not exists or indexed:
+            return
+
+        conn.execute(text(
+            "UPDATE main.invoices SET invoice_month = substr(invoice_month, 1, 7) || '-01' "
+            "WHERE invoice_month IS NOT NULL AND invoice_month != substr(invoice_month, 1, 7) || '-01'"
+        ))
+        groups = (
+            "FROM main.invoices GROUP BY supplier_id, product_id, invoice_month "
+            "HAVING COUNT(*) > 1"
+        )
+        duplicates = (
+            "FROM main.invoices WHERE invoice_id NOT IN ("
+            "SELECT MAX(invoice_id) FROM main.invoices "
+            "GROUP BY supplier_id, product_id, invoice_month)"
+        )
+        if conn.execute(text(f"SELECT 1 {duplicates} LIMIT 1")).first():
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS main.invoices_duplicates AS SELECT * {duplicates} LIMIT 0"
+            ))
+            conn.execute(text(f"INSERT INTO main.invoices_duplicates SELECT * {duplicates}"))
+            conn.execute(text(
+                "UPDATE main.invoices AS i SET "
+                "price = CASE WHEN g.prices > 1 AND g.quantity > 0 "
+                "THEN ROUND(1.0 * g.total_amount / g.quantity) ELSE i.price END, "
+                "quantity = g.quantity, total_amount = g.total_amount, "
+                "total_paid = g.total_paid, total_debt = g.total_amount - g.total_paid "
+                "FROM (SELECT MAX(invoice_id) AS keep_id, SUM(quantity) AS quantity, "
+                "SUM(total_amount) AS total_amount, SUM(COALESCE(total_paid, 0)) AS total_paid, "
+                "COUNT(DISTINCT CAST(ROUND(price) AS INTEGER)) AS prices "
+                f"{groups}) AS g WHERE i.invoice_id = g.keep_id"
+            ))
+            conn.execute(text(f"DELETE {duplicates}"))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX uq_invoices_natural_key "
+            "ON invoices (supplier_id, product_id, invoice_month)"
+        ))
+
+
+def reconcile_archive(bind, tables=None):
+    """Ở chế độ WAL, transaction ghi cả main và archive không nguyên tử giữa
+    hai file, nên services.archive chuyển dòng bằng hai commit (archive trước)
+    và đánh dấu bảng trong pending_moves. Dấu cũ hơn MOVE_TIMEOUT nghĩa là
+    lần chuyển đã dừng giữa chừng: dòng có thể nằm ở cả hai file và UNION
+    đếm hai lần. Giữ bản nóng (có thể đã sửa sau đó), xoá bản archive trùng
+    khoá chính. Dấu mới hơn được bỏ qua vì lần chuyển đó có thể còn chạy và
+    sẽ tự xoá khỏi main đúng các dòng đã có trong archive. tables: dọn các
+    bảng này bất kể dấu (DB vừa khôi phục từ snapshot)."""
+    with bind.begin() as conn:
+        if tables is None:
+            marker = ArchivePending.c
+            stale = datetime.utcnow() - MOVE_TIMEOUT
+            tables = conn.execute(
+                select(marker.table_name).where(marker.started_at < stale)
+            ).scalars().all()
+            if not tables:
+                return
+        for name in tables:
+            pk = Base.metadata.tables[name].primary_key.columns[0].name
+            conn.execute(text(
+                f'DELETE FROM {ARCHIVE_SCHEMA}."{name}" '
+                f'WHERE "{pk}" IN (SELECT "{pk}" FROM main."{name}")'
+            ))
+        conn.execute(ArchivePending.delete().where(ArchivePending.c.table_name.in_(tables)))
+
+
+# Engine đã init trong process này: trang gọi init_db() ở mọi lần chạy
+_READY = set()
+
+
+def init_db(bind=None):
+    """Migration, bảng, chỉ mục, trigger; mỗi engine chỉ chạy một lần trong
+    process (khởi động lại app để áp dụng bản nâng cấp)"""
+    bind = bind or engine
+    if bind in _READY:
+        return
+    migrate_invoice_natural_key(bind)
+    migrate_money_columns(bind)
+    Base.metadata.create_all(bind)
+    # create_all bỏ qua bảng đã có, nên index mới thêm vào model phải tạo riêng
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+    reconcile_archive(bind)
+    search.init_search(bind, ARCHIVE_SCHEMA)
+    analytics.init_change_log(bind)
+    ledger.init_ledger(bind)
+    _READY.add(bind)
+
+
+@contextmanager
+def session_scope(factory=None):
+    """Session cho batch job / benchmark: commit khi xong, rollback khi lỗi"""
+    session = (factory or SessionLocal)()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
@@ -1,43 +1,47 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 from datetime import datetime
-from models import SessionLocal, Personal_Spending, ChatHistory
+from models import SessionLocal, init_db, engine, session_scope
+from services.finance import (
+    TransactionRepository, ChatRepository, TYPES, SUMMARY_COLUMNS,
+    add_period_columns, monthly_summary, yearly_summary,
+    build_financial_context
+)
+from services.money import format_money
+from services.downsample import downsample
 import io
 from openai import OpenAI
 import os
 from dotenv import load_dotenv
+import profiling
+import analytics
+import tables
+import fragments
 
 load_dotenv()
 
 st.set_page_config(page_title="💰 Quản lý Chi tiêu", layout="wide")
 st.title("💰 Quản lý Chi tiêu")
+profiling.start_run("Finance")
 
+init_db()
 session = SessionLocal()
+repo = TransactionRepository(session)
+chats = ChatRepository(session)
+fragments.start_page()
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Chuỗi thời gian: số điểm tối đa mỗi đường (~ độ rộng biểu đồ theo pixel)
+# và ngưỡng chuyển sang trace WebGL
+CHART_POINTS = 1500
+WEBGL_POINTS = 1000
+PERIODS = {"Tự động": None, "Ngày": "day", "Tuần": "week"}
+
 # Helpers
-def fetch_data(session):
-    data = session.query(Personal_Spending).order_by(Personal_Spending.transaction_date.desc()).all()
-    if not data:
-        return pd.DataFrame()
-    
-    df = pd.DataFrame([{
-        "Ngày": t.transaction_date,
-        "Loại": t.type,
-        "Danh mục": t.category,
-        "Số tiền": t.amount,
-        "Thu": t.amount if t.type == "Thu nhập" else 0,
-        "Chi": t.amount if t.type == "Chi tiêu" else 0
-    } for t in data])
-    
-    return df
-
-def plot_monthly(df):
-    monthly = df.groupby("Tháng")[["Thu", "Chi"]].sum().reset_index()
-    monthly["Tổng"] = monthly["Thu"] - monthly["Chi"]
-    
+def plot_monthly(monthly):
     fig = px.bar(
         monthly,
         x="Tháng",
@@ -48,12 +52,9 @@ def plot_monthly(df):
         text_auto=".0f"  
     )
     fig.update_layout(yaxis_title="Số tiền (VND)")
-    return fig, monthly
+    return fig
 
-def plot_yearly(df):
-    yearly = df.groupby("Năm")[["Thu", "Chi"]].sum().reset_index()
-    yearly["Tổng"] = yearly["Thu"] - yearly["Chi"]
-    
+def plot_yearly(yearly):
     fig = px.bar(
         yearly,
         x="Năm",
@@ -64,113 +65,141 @@ def plot_yearly(df):
         text_auto=".0f" 
     )
     fig.update_layout(yaxis_title="Số tiền (VND)", xaxis=dict(tickformat="d"))
-    return fig, yearly
+    return fig
+
+def plot_series(series, max_points=CHART_POINTS):
+    trace = go.Scattergl if len(series) > WEBGL_POINTS else go.Scatter
+    fig = go.Figure()
+    for col, color in (("Thu", "blue"), ("Chi", "orange")):
+        x, y = downsample(series["Ngày"], series[col], max_points)
+        fig.add_trace(trace(x=x, y=y, mode="lines", name=col, line=dict(color=color)))
+    fig.update_layout(
+        title="📈 Thu/Chi theo thời gian",
+        yaxis_title="Số tiền (VND)",
+        hovermode="x unified"
+    )
+    return fig
+
+# View tổng hợp phụ thuộc vào giao dịch: sửa đánh dấu chúng cũ
+FINANCE_VIEWS = ("finance_table", "finance_charts")
+
+
+def transaction_row(t):
+    """Bản chụp một giao dịch cho fragment"""
+    return {
+        "amount": int(t.amount),
+        "type": t.type,
+        "category": t.category,
+        "transaction_date": t.transaction_date,
+    }
+
+
+# Ghi trong on_click (chạy trước thân fragment), rồi refresh(): bảng và
+# biểu đồ bị đánh dấu cũ, trang chạy lại một lần
+def save_transaction(transaction_id):
+    state = st.session_state
+    with session_scope() as s:
+        repo = TransactionRepository(s)
+        t = repo.update(
+            repo.get(transaction_id),
+            state[f"tx_amount_{transaction_id}"],
+            state[f"tx_type_{transaction_id}"],
+            state[f"tx_category_{transaction_id}"],
+            state[f"tx_date_{transaction_id}"],
+        )
+        s.flush()
+        row = transaction_row(t)
+    fragments.set_row_state("transaction_row", transaction_id, row)
+    fragments.refresh(*FINANCE_VIEWS)
+    fragments.notify("transaction_row", transaction_id, "✅ Đã cập nhật")
 
-def render_edit_transaction(session, t):
-    sign = "+" if t.type == "Thu nhập" else "-"
+
+# Mỗi giao dịch là một fragment: nhập liệu trong form chỉ chạy lại giao dịch đó
+@st.fragment
+def render_edit_transaction(transaction_id, initial):
+    fragments.rerun_if_refreshed()
+    fragments.show_notice("transaction_row", transaction_id)
+    t = fragments.row_state("transaction_row", transaction_id, initial)
+    sign = "+" if t["type"] == "Thu nhập" else "-"
 
     with st.expander(
-        f"{sign}{t.amount:,.0f} 👉 {t.category} 🗓️ {t.transaction_date:%d-%m-%Y}"
+        f"{sign}{format_money(t['amount'])} 👉 {t['category']} 🗓️ {t['transaction_date']:%d-%m-%Y}"
     ):
-        with st.form(key=f"form_{t.transaction_id}"):
+        with st.form(key=f"form_{transaction_id}"):
 
             col1, col2, col3 = st.columns(3)
 
             with col1:
-                amount = st.number_input(
+                st.number_input(
                     "Số tiền",
-                    value=t.amount,
-                    min_value=0.0,
-                    step=1000.0,
-                    format="%0.0f"
+                    value=t["amount"],
+                    min_value=0,
+                    step=1000,
+                    format="%d",
+                    key=f"tx_amount_{transaction_id}"
                 )
-                type_ = st.selectbox(
+                st.selectbox(
                     "Loại",
-                    ["Thu nhập", "Chi tiêu"],
-                    index=0 if t.type == "Thu nhập" else 1
+                    TYPES,
+                    index=TYPES.index(t["type"]),
+                    key=f"tx_type_{transaction_id}"
                 )
 
             with col2:
-                cat = st.text_input("Danh mục", value=t.category)
-                d = st.date_input("Ngày", value=t.transaction_date)
+                st.text_input("Danh mục", value=t["category"], key=f"tx_category_{transaction_id}")
+                st.date_input("Ngày", value=t["transaction_date"], key=f"tx_date_{transaction_id}")
 
             with col3:
-                save = st.form_submit_button("💾 Sửa")
+                st.form_submit_button(
+                    "💾 Sửa", on_click=save_transaction, args=(transaction_id,)
+                )
                 delete = st.form_submit_button("🗑️ Xoá")
 
-            if save:
-                t.amount = amount
-                t.type = type_
-                t.category = cat
-                t.transaction_date = d
-                session.commit()
-                st.success("✅ Đã cập nhật")
-                st.rerun()
-
             if delete:
-                session.delete(t)
-                session.commit()
+                # Danh sách đổi cấu trúc: chạy lại cả trang
+                with session_scope() as s:
+                    repo = TransactionRepository(s)
+                    repo.delete(repo.get(transaction_id))
                 st.warning("🗑️ Đã xoá")
                 st.rerun()
 
-def build_financial_context(df):
-    monthly = df.groupby("Tháng")[["Thu", "Chi"]].sum()
-    yearly = df.groupby("Năm")[["Thu", "Chi"]].sum()
-    category = df.groupby("Danh mục")[["Thu", "Chi"]].sum()
-
-    total_income = df["Thu"].sum()
-    total_expense = df["Chi"].sum()
-
-    saving_rate = 0
-    if total_income > 0:
-        saving_rate = (total_income - total_expense) / total_income * 100
-
-    return f"""
-Tổng thu: {total_income:,.0f}
-Tổng chi: {total_expense:,.0f}
-Tỉ lệ tiết kiệm: {saving_rate:.2f}%
-
-Theo tháng:
-{monthly.to_string()}
-
-Theo năm:
-{yearly.to_string()}
-
-Theo danh mục:
-{category.to_string()}
-"""
-
 # Set view limit
 if "edit_limit" not in st.session_state:
     st.session_state.edit_limit = 10
 
 # Nhập chi tiêu mới
-amount = st.number_input("Số tiền", min_value=0.0, step=1000.0, format="%0.0f")
-type_ = st.selectbox("Loại", ["Thu nhập", "Chi tiêu"])
+profiling.checkpoint("form")
+amount = st.number_input("Số tiền", min_value=0, step=1000, format="%d")
+type_ = st.selectbox("Loại", TYPES)
 cat = st.text_input("Danh mục")
 d = st.date_input("Ngày")
 
 if st.button("➕ Ghi nhận"):
-    session.add(Personal_Spending(
-        amount=amount,
-        type=type_,
-        category=cat,
-        transaction_date=d
-    ))
+    repo.add(amount, type_, cat, d)
     session.commit()
     st.success("✅ Đã ghi nhận")
 
 st.divider()
 
 # Chỉnh sửa / Xoá chi tiêu
+profiling.checkpoint("edit list")
 st.subheader("✏️ Chỉnh sửa / Xoá chi tiêu")
 
-total_count = session.query(Personal_Spending).count()
+def load_recent(limit):
+    """([(transaction_id, bản chụp)], tổng số giao dịch); sửa một giao dịch
+    không làm cũ danh sách này (dòng đó đã có bản mới trong row_state)"""
+    with session_scope() as s:
+        r = TransactionRepository(s)
+        return [(t.transaction_id, transaction_row(t)) for t in r.recent(limit)], r.count()
+
 
-data = session.query(Personal_Spending).order_by(Personal_Spending.transaction_date.desc()).limit(st.session_state.edit_limit).all()
+data, total_count = fragments.cached(
+    "finance_list", (st.session_state.edit_limit,),
+    lambda: load_recent(st.session_state.edit_limit)
+)
 if data:
-    for t in data:
-        render_edit_transaction(session, t)
+    for transaction_id, row in data:
+        render_edit_transaction(transaction_id, row)
     if st.session_state.edit_limit < total_count:
         if st.button("➕ Xem thêm"):
             st.session_state.edit_limit += 10
@@ -179,39 +208,151 @@ else:
     st.info("Chưa có chi tiêu nào được ghi nhận.")
 
 # DataFrame và hiển thị
+profiling.checkpoint("load")
 st.subheader("📋 Danh sách chi tiêu")
-df = fetch_data(session)
-if not df.empty:
-    df["Ngày"] = pd.to_datetime(df["Ngày"])
-    df["Ngày hiển thị"] = df["Ngày"].dt.strftime("%d-%m-%Y")
-    df.index = range(1, len(df) + 1)
-    st.dataframe(df[["Danh mục","Số tiền","Thu","Chi","Ngày hiển thị"]], width='stretch')
+include_archive = st.toggle("🗄️ Gồm dữ liệu các năm đã đóng sổ", key="finance_archive")
+
+
+def load(method, *args, **kwargs):
+    """Gọi TransactionRepository trong session riêng (dùng trong fragment)"""
+    with session_scope() as s:
+        return getattr(TransactionRepository(s), method)(*args, **kwargs)
+
+
+# Các view tổng hợp: lọc / sắp xếp chỉ chạy lại view đó, chỉ truy vấn lại
+# khi tham số đổi hoặc bị đánh dấu cũ
+@st.fragment
+def transactions_view(include_archive):
+    c1, c2 = st.columns([4, 2])
+    tx_query = c1.text_input(
+        "Lọc theo danh mục", key="tx_query",
+        on_change=tables.reset_page, args=("tx",)
+    )
+    tx_type = c2.selectbox(
+        "Loại", [None, *TYPES], key="tx_type",
+        format_func=lambda x: x or "Tất cả",
+        on_change=tables.reset_page, args=("tx",)
+    )
+    sort, descending = tables.sort_controls("tx", SUMMARY_COLUMNS, "Ngày", descending=True)
+    offset = tables.page_offset("tx")
+    page, tx_rows = fragments.cached(
+        "finance_table", (sort, descending, tx_query, tx_type, include_archive, offset),
+        lambda: load(
+            "summary_page", sort, descending, tx_query, tx_type, include_archive,
+            limit=tables.PAGE_SIZE, offset=offset
+        )
+    )
+    st.dataframe(
+        page,
+        width='stretch',
+        hide_index=True,
+        column_config={
+            "Ngày": tables.date_column("Ngày"),
+            **{c: tables.money_column(c) for c in ["Số tiền", "Thu", "Chi"]},
+        }
+    )
+    tables.page_footer("tx", tx_rows, label="giao dịch")
+
+
+def load_charts(include_archive):
+    # Tổng hợp từ mirror DuckDB khi bật APP_ANALYTICS=duckdb
+    mirror = analytics.get_mirror(engine)
+    if mirror:
+        return (
+            mirror.finance_monthly(include_archive),
+            mirror.finance_yearly(include_archive),
+            mirror.finance_date_bounds(include_archive),
+        )
+    df = add_period_columns(load("fetch_data", include_archive))
+    return (
+        monthly_summary(df),
+        yearly_summary(df),
+        load("date_bounds", include_archive),
+    )
+
+
+def load_series(start, end, period, include_archive):
+    mirror = analytics.get_mirror(engine)
+    if mirror:
+        return mirror.finance_series(start, end, period, include_archive)
+    return load("series", start, end, period, include_archive)
+
+
+@st.fragment
+def charts_view(include_archive):
+    monthly, yearly, bounds = fragments.cached(
+        "finance_charts", (include_archive,), lambda: load_charts(include_archive)
+    )
+    st.plotly_chart(plot_monthly(monthly), use_container_width=True)
+    st.plotly_chart(plot_yearly(yearly), use_container_width=True)
+
+    # Chuỗi theo ngày / tuần: cộng trong SQL cho đúng khoảng đang xem rồi
+    # giảm còn <= CHART_POINTS điểm. Plotly trong Streamlit không báo sự kiện
+    # zoom về server nên "zoom" là thanh chọn khoảng ngày, mỗi lần đổi sẽ
+    # truy vấn lại ở độ chi tiết cao hơn.
+    if bounds:
+        first, last = (pd.Timestamp(b).date() for b in bounds)
+        c1, c2 = st.columns([2, 8])
+        period = c1.radio("Độ chi tiết", list(PERIODS), horizontal=True)
+        start, end = c2.slider(
+            "Khoảng thời gian",
+            min_value=first,
+            max_value=max(last, first + pd.Timedelta(days=1)),
+            value=(first, last),
+            format="DD/MM/YYYY"
+        )
+        period = PERIODS[period] or (
+            "day" if (end - start).days <= CHART_POINTS else "week"
+        )
+        series = fragments.cached(
+            "finance_charts", (start, end, period, include_archive),
+            lambda: load_series(start, end, period, include_archive)
+        )
+        st.plotly_chart(plot_series(series), use_container_width=True)
+        st.caption(
+            f"{len(series):,} điểm theo {'ngày' if period == 'day' else 'tuần'}"
+            + (f", hiển thị {CHART_POINTS:,} điểm đại diện" if len(series) > CHART_POINTS else "")
+        )
+
+
+if total_count:
+    transactions_view(include_archive)
 
     # Biểu đồ tổng hợp
+    profiling.checkpoint("charts")
     st.subheader("📊 Dashboard tổng hợp")
-    df["Tháng"] = df["Ngày"].dt.strftime("%b-%Y") 
-    df["Năm"] = df["Ngày"].dt.year
-    fig_month, monthly_summary = plot_monthly(df)
-    st.plotly_chart(fig_month, use_container_width=True)
-    
-    fig_year, yearly_summary = plot_yearly(df)
-    st.plotly_chart(fig_year, use_container_width=True)
+    charts_view(include_archive)
 
 # Xuất Excel
+profiling.checkpoint("export")
 st.subheader("📥 Xuất dữ liệu chi tiêu")
-export_df = df.drop(columns=["Ngày", "Tháng", "Năm", "Thu", "Chi"], errors="ignore")
-output = io.BytesIO()
-export_df.to_excel(output, index=False)
-output.seek(0)
-st.download_button("📤 Xuất toàn bộ chi tiêu", data=output, file_name="chi_tieu.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+
+def build_export():
+    # Chỉ chạy khi bấm tải (thread riêng của Streamlit), không ở mỗi lần chạy trang
+    export_df = load("fetch_data", include_archive).drop(columns=["Thu", "Chi"], errors="ignore")
+    if not export_df.empty:
+        export_df["Ngày hiển thị"] = export_df.pop("Ngày").dt.strftime("%d-%m-%Y")
+    output = io.BytesIO()
+    export_df.to_excel(output, index=False)
+    return output.getvalue()
+
+
+st.download_button(
+    "📤 Xuất toàn bộ chi tiêu", data=build_export, file_name="chi_tieu.xlsx",
+    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    on_click="ignore"
+)
 
 # Chatbot AI
+profiling.checkpoint("chatbot")
 st.subheader("🤖 Trợ lý tài chính AI")
 question = st.text_input("Hỏi về chi tiêu của bạn")
 
 if st.button("💬 Hỏi AI"):
-    if not df.empty and question:
+    if total_count and question:
 
+        df = add_period_columns(repo.fetch_data(include_archive=include_archive))
         context = build_financial_context(df)
 
         messages = [
@@ -245,23 +386,18 @@ Câu hỏi:
         answer = response.choices[0].message.content
         st.success(answer)
 
-        session.add(ChatHistory(
-            question=question,
-            answer=answer
-        ))
+        chats.add(question, answer)
         session.commit()
 
 # CHAT HISTORY
 st.subheader("📜 Lịch sử hỏi đáp")
 
-history = session.query(ChatHistory)\
-    .order_by(ChatHistory.created_at.desc())\
-    .limit(10)\
-    .all()
+history = chats.recent(10)
 
 for h in history:
     st.markdown(f"**🧑 Bạn:** {h.question}")
     st.markdown(f"**🤖 AI:** {h.answer}")
     st.divider()
 
+profiling.finish_run()
 session.close()
@@ -1,142 +1,93 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from models import (
-    SessionLocal, init_db,
-    Supplier, Product, Invoice
+from models import SessionLocal, init_db, engine, session_scope, Invoice, Payment
+from services.invoices import (
+    InvoiceRepository, validate_invoice, to_date, export_frame,
+    SUMMARY_COLUMNS, AGING_COLUMNS
+)
+from services.money import format_money
+from services.importer import (
+    parse_workbooks, commit_reports, split_new_files, file_hash
 )
 import io
+import profiling
+import analytics
+import tables
+import fragments
 
 # CONFIG
 st.set_page_config(page_title="Hoá đơn NCC", layout="wide")
 st.title("📄 Quản lý Hoá đơn Nhà cung cấp")
+profiling.start_run("Invoice")
 
 init_db()
 session = SessionLocal()
-
-# HELPERS
-def calculate(price, quantity, paid):
-    total = price * quantity
-    debt = total - paid
-    return total, debt
-
-
-def validate_invoice(price, quantity, paid):
-    if price < 0:
-        return False, "Giá không hợp lệ"
-    if quantity <= 0:
-        return False, "Số lượng phải > 0"
-    if paid < 0:
-        return False, "Đã trả không hợp lệ"
-    if paid > price * quantity:
-        return False, "Đã trả > Tổng tiền"
-    return True, ""
-
-
-def get_or_create_supplier_product(session, supplier_name, product_name):
-    supplier_name = supplier_name.strip()
-    product_name = product_name.strip()
-
-    if not supplier_name or not product_name:
-        raise ValueError("Nhà cung cấp / Sản phẩm không được để trống")
-
-    supplier = session.query(Supplier).filter_by(
-        supplier_name=supplier_name
-    ).first()
-
-    if not supplier:
-        supplier = Supplier(supplier_name=supplier_name)
-        session.add(supplier)
-        session.flush()
-
-    product = session.query(Product).filter_by(
-        product_name=product_name,
-        supplier_id=supplier.supplier_id
-    ).first()
-
-    if not product:
-        product = Product(
-            product_name=product_name,
-            supplier_id=supplier.supplier_id
-        )
-        session.add(product)
-        session.flush()
-
-    return supplier, product
-
-def to_date(value):
-    """Chuyển giá trị invoice_month sang datetime.date"""
-    if isinstance(value, str):
-        try:
-            return datetime.strptime(value, "%Y-%m-%d").date()
-        except ValueError:
-            # Nếu chỉ là YYYY-MM
-            return datetime.strptime(value + "-01", "%Y-%m-%d").date()
-    elif isinstance(value, pd.Timestamp):
-        return value.date()
-    elif isinstance(value, datetime):
-        return value.date()
-    else:
-        return value  
+repo = InvoiceRepository(session)
+fragments.start_page()
 
 # IMPORT EXCEL
+profiling.checkpoint("import")
 st.subheader("📥 Import Excel")
 
-file = st.file_uploader(
+files = st.file_uploader(
     "File Excel (Nhà cung cấp | Sản phẩm | Tháng | Giá | Số lượng | Đã trả | Nợ)",
-    type=["xlsx"]
+    type=["xlsx"],
+    accept_multiple_files=True
 )
-if file:
-    df_import = pd.read_excel(file)
-    st.dataframe(df_import, width='stretch')
+# Đọc 10 dòng xem trước một lần cho mỗi nội dung file, không đọc lại
+# workbook ở mọi lần rerun; bỏ bản của file đã gỡ khỏi uploader
+files = files or []
+previews = st.session_state.get("import_previews", {})
+hashes = [file_hash(f.getvalue()) for f in files]
+st.session_state["import_previews"] = previews = {
+    h: previews[h] if h in previews else pd.read_excel(f, nrows=10)
+    for f, h in zip(files, hashes)
+}
+if files:
+    for f, h in zip(files, hashes):
+        with st.expander(f"📄 {f.name}"):
+            st.dataframe(previews[h], width='stretch')
 
     if st.button("⚙️ Xử lý hoá đơn"):
-        errors = []
-
         try:
-            for idx, row in df_import.iterrows():
-                valid, msg = validate_invoice(
-                    row["Giá"],
-                    row["Số lượng"],
-                    row["Đã trả"]
-                )
-                if not valid:
-                    errors.append(f"Dòng {idx + 1}: {msg}")
-                    continue
-
-                supplier, product = get_or_create_supplier_product(
-                    session,
-                    row["Nhà cung cấp"],
-                    row["Sản phẩm"]
-                )
-
-                total, debt = calculate(
-                    row["Giá"],
-                    row["Số lượng"],
-                    row["Đã trả"]
+            new_files, skipped = split_new_files(
+                session, [(f.name, f.getvalue()) for f in files]
+            )
+            for name in skipped:
+                st.info(f"⏭️ {name}: đã import trước đó, bỏ qua")
+
+            with st.spinner(f"Đang đọc {len(new_files)} file..."):
+                reports = parse_workbooks(new_files)
+
+            for r in reports:
+                if r["errors"]:
+                    with st.expander(f"❌ {r['file']}: {len(r['errors'])} lỗi", expanded=True):
+                        for e in r["errors"]:
+                            st.error(e)
+                else:
+                    st.write(f"✅ {r['file']}: {len(r['rows'])} hoá đơn hợp lệ")
+
+            result = commit_reports(session, reports) if reports else None
+            if result:
+                st.success(
+                    f"✅ Import {result['rows']} hoá đơn từ {len(reports)} file: "
+                    f"{result['written']} dòng mới / thay đổi, "
+                    f"{result['rows'] - result['written'] - result['archived'] - result['paid_lower']}"
+                    " dòng không đổi"
                 )
-
-                month_date = to_date(row["Tháng"])
-
-                session.add(Invoice(
-                    supplier_id=supplier.supplier_id,
-                    product_id=product.product_id,
-                    invoice_month=month_date,
-                    price=row["Giá"],
-                    quantity=row["Số lượng"],
-                    total_amount=total,
-                    total_paid=row["Đã trả"],
-                    total_debt=debt
-                ))
-
-            if errors:
-                session.rollback()
-                for e in errors:
-                    st.error(e)
+                if result["archived"]:
+                    st.info(
+                        f"🗄️ Bỏ qua {result['archived']} dòng của hoá đơn đã trả đủ "
+                        "và được lưu trữ"
+                    )
+                if result["paid_lower"]:
+                    st.warning(
+                        f"⚠️ Bỏ qua {result['paid_lower']} dòng có \"Đã trả\" thấp hơn số "
+                        "đã ghi nhận – xoá thanh toán ở danh sách hoá đơn nếu cần giảm"
+                    )
+            elif reports:
                 st.error("❌ Import thất bại – không có dữ liệu nào được lưu")
-            else:
-                session.commit()
-                st.success("✅ Import thành công")
 
         except Exception as e:
             session.rollback()
@@ -144,6 +95,7 @@ if file:
             st.exception(e)
 
 # INPUT TAY
+profiling.checkpoint("form")
 st.subheader("➕ Nhập hoá đơn thủ công")
 
 with st.form("add_invoice", clear_on_submit=True):
@@ -157,9 +109,9 @@ with st.form("add_invoice", clear_on_submit=True):
         month = st.date_input("Tháng (YYYY-MM)", value=datetime.today())
         price = st.number_input(
             "Giá",
-            min_value=0.0,
-            step=1000.0,
-            format="%.0f"
+            min_value=0,
+            step=1000,
+            format="%d"
         )
 
     with col3:
@@ -170,9 +122,9 @@ with st.form("add_invoice", clear_on_submit=True):
         )
         paid = st.number_input(
             "Đã trả",
-            min_value=0.0,
-            step=1000.0,
-            format="%.0f"
+            min_value=0,
+            step=1000,
+            format="%d"
         )
 
     submit = st.form_submit_button("💾 Lưu")
@@ -183,183 +135,345 @@ if submit:
         st.error(msg)
     else:
         try:
-            supplier, product = get_or_create_supplier_product(
-                session,
-                supplier_name,
-                product_name
-            )
-
-            total, debt = calculate(price, quantity, paid)
-
-            session.add(Invoice(
-                supplier_id=supplier.supplier_id,
-                product_id=product.product_id,
-                invoice_month=month,
-                price=price,
-                quantity=quantity,
-                total_amount=total,
-                total_paid=paid,
-                total_debt=debt
-            ))
+            repo.add(supplier_name, product_name, month, price, quantity, paid)
             session.commit()
             st.success("✅ Đã thêm hoá đơn")
 
+        except ValueError as e:
+            session.rollback()
+            st.error(f"❌ {e}")
+
         except Exception as e:
             session.rollback()
             st.error("❌ Lỗi khi lưu")
             st.exception(e)
 
 
-# LOAD DATA
-data = (
-    session.query(Invoice, Supplier, Product)
-    .select_from(Invoice)
-    .join(Supplier)
-    .join(Product)
-    .order_by(Invoice.invoice_id.desc())
-    .all()
-)
+# View tổng hợp phụ thuộc vào hoá đơn: sửa / thanh toán đánh dấu chúng cũ.
+# Trang danh sách ("invoice_list") không nằm trong đó: dòng vừa sửa đã có
+# bản mới trong row_state, lần chạy sau refresh() dùng lại phần còn lại
+INVOICE_VIEWS = ("invoice_summary", "invoice_dashboard", "invoice_aging")
+
+
+def invoice_row(i, s, p, invoice_payments):
+    """Bản chụp một hoá đơn cho fragment (không giữ object ORM qua các lần chạy)"""
+    return {
+        "supplier_name": s.supplier_name,
+        "product_name": p.product_name,
+        "invoice_month": i.invoice_month,
+        "price": int(i.price),
+        "quantity": int(i.quantity),
+        "total_paid": int(i.total_paid),
+        "total_debt": int(i.total_debt),
+        "payments": [
+            (pm.payment_id, pm.payment_date, int(pm.amount), pm.note) for pm in invoice_payments
+        ],
+    }
+
+
+def load(method, *args, **kwargs):
+    """Gọi InvoiceRepository trong session riêng (fragment chạy không qua session của trang)"""
+    with session_scope() as s:
+        return getattr(InvoiceRepository(s), method)(*args, **kwargs)
+
+
+def load_page(offset):
+    """Một trang danh sách: ([(invoice_id, bản chụp)], tổng số hoá đơn)"""
+    with session_scope() as s:
+        r = InvoiceRepository(s)
+        data = r.list_with_parties(limit=tables.PAGE_SIZE, offset=offset)
+        payments = r.payments_by_invoice([i.invoice_id for i, _, _ in data])
+        return [
+            (i.invoice_id, invoice_row(i, sup, p, payments.get(i.invoice_id, [])))
+            for i, sup, p in data
+        ], r.count()
+
+
+def reload_invoice(invoice_id):
+    with session_scope() as s:
+        r = InvoiceRepository(s)
+        i, sup, p = r.get_with_parties(invoice_id)
+        row = invoice_row(i, sup, p, r.payments_by_invoice([invoice_id]).get(invoice_id, []))
+    fragments.set_row_state("invoice_row", invoice_id, row)
+    fragments.refresh(*INVOICE_VIEWS)
+
+
+# Ghi trong on_click (chạy trước thân fragment). Ghi được thì refresh():
+# các view tổng hợp bị đánh dấu cũ và trang chạy lại một lần; lỗi thì chỉ
+# dòng đó chạy lại để báo
+def edit_invoice(invoice_id):
+    state = st.session_state
+    try:
+        with session_scope() as s:
+            InvoiceRepository(s).update(
+                s.get(Invoice, invoice_id),
+                state[f"amount_{invoice_id}"],
+                state[f"quantity_{invoice_id}"],
+                state[f"month_{invoice_id}"],
+            )
+    except ValueError as e:
+        fragments.notify("invoice_row", invoice_id, f"❌ {e}")
+        return
+    reload_invoice(invoice_id)
+    fragments.notify("invoice_row", invoice_id, "✅ Đã cập nhật")
+
+
+def pay_invoice(invoice_id):
+    state = st.session_state
+    try:
+        with session_scope() as s:
+            InvoiceRepository(s).add_payment(
+                s.get(Invoice, invoice_id),
+                state[f"pay_amount_{invoice_id}"],
+                state[f"pay_date_{invoice_id}"],
+            )
+    except ValueError as e:
+        fragments.notify("invoice_row", invoice_id, f"❌ {e}")
+        return
+    reload_invoice(invoice_id)
+    fragments.notify("invoice_row", invoice_id, "💵 Đã ghi thanh toán")
+
+
+def remove_payment(invoice_id, payment_id):
+    # Sửa khoản trả nhầm: xoá rồi ghi lại; trigger ledger trừ lại số đã trả
+    with session_scope() as s:
+        payment = s.get(Payment, payment_id)
+        if payment is not None:
+            InvoiceRepository(s).delete_payment(payment)
+    reload_invoice(invoice_id)
+    fragments.notify("invoice_row", invoice_id, "🗑️ Đã xoá thanh toán")
+
+
 # DASHBOARD
+profiling.checkpoint("list")
 st.subheader("📋 Danh sách hoá đơn")
-for i, s, p in data:
-    title = f"🏷️ {s.supplier_name} | {p.product_name} | {i.invoice_month}"
-    if i.total_debt > 0:
+
+# Mỗi hoá đơn là một fragment: nhập liệu và lỗi chỉ chạy lại đúng hoá đơn đó
+@st.fragment
+def invoice_item(invoice_id, initial):
+    fragments.rerun_if_refreshed()
+    fragments.show_notice("invoice_row", invoice_id)
+    i = fragments.row_state("invoice_row", invoice_id, initial)
+    title = f"🏷️ {i['supplier_name']} | {i['product_name']} | {i['invoice_month']}"
+    if i["total_debt"] > 0:
         title = "🔴 " + title
 
     with st.expander(title):
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            new_price = st.number_input(
+            st.number_input(
                 "Giá",
-                value=float(i.price),
-                step=1000.0,
-                format="%.0f",
-                key=f"amount_{i.invoice_id}"
+                value=i["price"],
+                step=1000,
+                format="%d",
+                key=f"amount_{invoice_id}"
             )
-            new_quantity = st.number_input(
+            st.number_input(
                 "Số lượng",
-                value=int(i.quantity),
+                value=i["quantity"],
                 step=1,
                 format="%d",
-                key=f"quantity_{i.invoice_id}"  
+                key=f"quantity_{invoice_id}"  
             )
 
         with col2:
-            new_paid = st.number_input(
-                "Đã trả",
-                value=float(i.total_paid),
-                step=1000.0,
-                format="%.0f",
-                key=f"paid_{i.invoice_id}"
-            )
-            new_month_value = to_date(i.invoice_month)
-            new_month = st.date_input(
+            new_month_value = to_date(i["invoice_month"])
+            st.date_input(
                 "Tháng (YYYY-MM)", 
                 value=new_month_value, 
-                key=f"month_{i.invoice_id}"
+                key=f"month_{invoice_id}"
+            )
+            st.caption(
+                f"Đã trả {format_money(i['total_paid'])} · Còn nợ {format_money(i['total_debt'])}"
             )
 
         with col3:
-            if st.button("💾 Sửa", key=f"edit_{i.invoice_id}"):
-                i.quantity = new_quantity
-                i.price = new_price    
-                i.total_amount = new_price * new_quantity
-                i.total_paid = new_paid
-                i.total_debt = i.total_amount - new_paid
-                i.invoice_month = new_month
-                session.commit()
-                st.success("✅ Đã cập nhật")
-
-            if st.button("🗑️ Xoá", key=f"delete_{i.invoice_id}"):
-                session.delete(i)
-                session.commit()
+            st.button(
+                "💾 Sửa", key=f"edit_{invoice_id}",
+                on_click=edit_invoice, args=(invoice_id,)
+            )
+
+            if st.button("🗑️ Xoá", key=f"delete_{invoice_id}"):
+                # Danh sách đổi cấu trúc: chạy lại cả trang
+                with session_scope() as s:
+                    InvoiceRepository(s).delete(s.get(Invoice, invoice_id))
                 st.warning("🗑️ Đã xoá")
                 st.rerun()
 
+        # Thanh toán (vượt số nợ thì add_payment báo lỗi)
+        pay1, pay2, pay3 = st.columns(3)
+        pay1.number_input(
+            "Thanh toán",
+            min_value=0,
+            step=1000,
+            format="%d",
+            key=f"pay_amount_{invoice_id}"
+        )
+        pay2.date_input(
+            "Ngày trả",
+            value=datetime.today(),
+            key=f"pay_date_{invoice_id}"
+        )
+        pay3.button(
+            "💵 Ghi thanh toán",
+            key=f"pay_{invoice_id}",
+            disabled=i["total_debt"] <= 0,
+            on_click=pay_invoice, args=(invoice_id,)
+        )
+
+        for payment_id, payment_date, amount, note in i["payments"]:
+            c1, c2 = st.columns([8, 1])
+            c1.caption(
+                f"💵 {payment_date} · {format_money(amount)}"
+                + (f" · {note}" if note else "")
+            )
+            c2.button(
+                "🗑️", key=f"delete_payment_{payment_id}", help="Xoá khoản thanh toán này",
+                on_click=remove_payment, args=(invoice_id, payment_id)
+            )
+
+profiling.checkpoint("load")
+offset = tables.page_offset("invoices")
+rows, invoice_count = fragments.cached("invoice_list", (offset,), lambda: load_page(offset))
+for invoice_id, row in rows:
+    invoice_item(invoice_id, row)
+tables.page_footer("invoices", invoice_count, label="hoá đơn")
+
 # SUMMARY TABLE
+profiling.checkpoint("summary")
 st.subheader("📊 Tổng hợp hoá đơn")
 
-summary = [
-    {
-        "Nhà cung cấp": s.supplier_name,
-        "Sản phẩm": p.product_name,
-        "Tháng": to_date(i.invoice_month).strftime('%Y-%m'),
-        "Giá": f"{i.price:,.0f}",
-        "Số lượng": f"{i.quantity:,}",
-        "Tổng tiền": f"{i.total_amount:,.0f}",
-        "Đã trả": f"{i.total_paid:,.0f}",
-        "Còn nợ": f"{i.total_debt:,.0f}",
-    }
-    for i, s, p in data
-]
+# Các view tổng hợp: lọc / sắp xếp chỉ chạy lại view đó, chỉ truy vấn lại
+# khi tham số đổi hoặc bị đánh dấu cũ
+@st.fragment
+def summary_view():
+    c1, c2 = st.columns([4, 1])
+    summary_query = c1.text_input(
+        "Lọc theo NCC / sản phẩm", key="summary_query",
+        on_change=tables.reset_page, args=("summary",)
+    )
+    debt_only = c2.toggle(
+        "Chỉ còn nợ", key="summary_debt_only",
+        on_change=tables.reset_page, args=("summary",)
+    )
+    sort, descending = tables.sort_controls("summary", SUMMARY_COLUMNS, "Tháng", descending=True)
+    offset = tables.page_offset("summary")
+    summary, summary_rows = fragments.cached(
+        "invoice_summary", (sort, descending, summary_query, debt_only, offset),
+        lambda: load(
+            "summary_page", sort, descending, summary_query, debt_only,
+            limit=tables.PAGE_SIZE, offset=offset
+        )
+    )
+    if summary_rows:
+        st.dataframe(
+            summary,
+            width='stretch',
+            hide_index=True,
+            column_config={
+                c: tables.money_column(c)
+                for c in ["Giá", "Tổng tiền", "Đã trả", "Còn nợ"]
+            }
+        )
+    else:
+        st.info("Chưa có hoá đơn nào.")
+    tables.page_footer("summary", summary_rows, label="hoá đơn")
+
 
-if summary:
-    df_summary = pd.DataFrame(summary)
-    df_summary.index = range(1, len(df_summary) + 1)
-    st.dataframe(df_summary, width='stretch')
-else:
-    st.info("Chưa có hoá đơn nào.")
+summary_view()
 
-# SUMMARY + CHART 
+# SUMMARY + CHART
+profiling.checkpoint("analysis")
 st.subheader("📊 Phân tích") 
 
-if data:
-    df = pd.DataFrame([{
-        "Nhà cung cấp": s.supplier_name,
-        "Sản phẩm": p.product_name,
-        "Tháng": pd.to_datetime(i.invoice_month),
-        "Tổng tiền": i.total_amount,
-        "Đã trả": i.total_paid,
-        "Còn nợ": i.total_debt
-    } for i, s, p in data])
+
+def load_dashboard(history):
+    # Tổng hợp từ mirror DuckDB khi bật APP_ANALYTICS=duckdb
+    mirror = analytics.get_mirror(engine)
+    with session_scope() as s:
+        dashboard = mirror or InvoiceRepository(s)
+        return (
+            dashboard.totals(include_archive=history),
+            dashboard.debt_by_supplier(include_archive=history),
+            dashboard.monthly_totals(include_archive=history),
+        )
+
+
+@st.fragment
+def analysis_view(has_data):
+    history = st.toggle("🗄️ Gồm hoá đơn đã lưu trữ", key="analysis_archive")
+    if not (has_data or history):
+        st.info("Chưa có dữ liệu")
+        return
+
+    totals, debt_by_supplier, monthly = fragments.cached(
+        "invoice_dashboard", (history,), lambda: load_dashboard(history)
+    )
 
     # KPI
     c1, c2, c3 = st.columns(3)
-    c1.metric("💰 Tổng phải chi", f"{df['Tổng tiền'].sum():,.0f}")
-    c2.metric("💸 Đã trả", f"{df['Đã trả'].sum():,.0f}")
-    c3.metric("🔴 Còn nợ", f"{df['Còn nợ'].sum():,.0f}")
+    c1.metric("💰 Tổng phải chi", format_money(totals["Tổng tiền"]))
+    c2.metric("💸 Đã trả", format_money(totals["Đã trả"]))
+    c3.metric("🔴 Còn nợ", format_money(totals["Còn nợ"]))
 
     # Charts
     # Top nợ theo NCC
     st.markdown("### 🔥 Top Nhà cung cấp còn nợ")
-    debt_by_supplier = (
-        df.groupby("Nhà cung cấp")["Còn nợ"]
-        .sum()
-        .sort_values(ascending=False)
-    )
-    st.bar_chart(debt_by_supplier)
+    st.bar_chart(debt_by_supplier.set_index("Nhà cung cấp")["Còn nợ"])
     # Công nợ theo tháng
     st.markdown("### 📈 Công nợ theo tháng")
-    monthly = (
-        df.groupby("Tháng")[["Tổng tiền", "Còn nợ"]]
-        .sum()
-        .sort_index()
-        .reset_index()
+    st.line_chart(monthly.set_index("Tháng")[["Tổng tiền", "Còn nợ"]])
+
+
+analysis_view(bool(invoice_count))
+
+# TUỔI NỢ
+profiling.checkpoint("aging")
+st.subheader("⏳ Tuổi nợ theo nhà cung cấp")
+
+
+@st.fragment
+def aging_view():
+    offset = tables.page_offset("aging")
+    aging, aging_rows = fragments.cached(
+        "invoice_aging", (offset,),
+        lambda: load("aging_report", limit=tables.PAGE_SIZE, offset=offset)
     )
-    monthly['Tháng_str'] = monthly['Tháng'].dt.strftime('%Y-%m')
-    monthly = monthly.set_index('Tháng_str')
-    st.line_chart(monthly[["Tổng tiền", "Còn nợ"]])
+    if aging_rows:
+        st.dataframe(
+            aging,
+            width='stretch',
+            hide_index=True,
+            column_config={c: tables.money_column(c) for c in AGING_COLUMNS[3:]}
+        )
+    else:
+        st.info("Không còn hoá đơn nợ.")
+    tables.page_footer("aging", aging_rows, label="dòng NCC / sản phẩm còn nợ")
+
 
-else:
-    st.info("Chưa có dữ liệu")
+aging_view()
 
 # Xuất Excel
+profiling.checkpoint("export")
 st.subheader("📥 Xuất dữ liệu hoá đơn")
-output = io.BytesIO()
-excel_df = pd.DataFrame([{
-    "Nhà cung cấp": s.supplier_name,
-    "Sản phẩm": p.product_name,     
-    "Tháng": i.invoice_month,   
-    "Giá": i.price,
-    "Số lượng": i.quantity,
-    "Tổng tiền": i.total_amount,
-    "Đã trả": i.total_paid,
-    "Còn nợ": i.total_debt
-} for i, s, p in data])
-excel_df.to_excel(output, index=False)
-output.seek(0)
-st.download_button("📤 Xuất toàn bộ hoá đơn", data=output, file_name="hoa_don.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+export_archive = st.toggle("🗄️ Gồm hoá đơn đã lưu trữ", key="export_archive")
 
 
+def build_export():
+    # Chỉ chạy khi bấm tải (thread riêng của Streamlit), không ở mỗi lần chạy trang
+    with session_scope() as s:
+        df = export_frame(InvoiceRepository(s).list_with_parties(include_archive=export_archive))
+    output = io.BytesIO()
+    df.to_excel(output, index=False)
+    return output.getvalue()
+
+
+st.download_button(
+    "📤 Xuất toàn bộ hoá đơn", data=build_export, file_name="hoa_don.xlsx",
+    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    on_click="ignore"
+)
+
+profiling.finish_run()
 session.close()
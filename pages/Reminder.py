@@ -1,37 +1,27 @@
 import streamlit as st
-import pandas as pd
-from datetime import date, timedelta
-from models import SessionLocal, init_db, Document, Department
+from models import SessionLocal, init_db, session_scope
+import profiling
+import tables
+import fragments
+from services.documents import (
+    DocumentRepository, has_overdue, STATUSES, LABELS, SUMMARY_COLUMNS
+)
 
 # CONFIG
 st.set_page_config(page_title="Reminder Văn bản", layout="wide")
 st.title("⏰ Reminder Văn bản")
+profiling.start_run("Reminder")
 
 init_db()
 session = SessionLocal()
+repo = DocumentRepository(session)
+fragments.start_page()
 
 # set session state
 if "edit_limit" not in st.session_state:
     st.session_state.edit_limit = 10
 
 #  HELPERS 
-def get_or_create_department(session, name: str):
-    name = name.strip()
-    dept = session.query(Department).filter_by(department_name=name).first()
-    if not dept:
-        dept = Department(department_name=name)
-        session.add(dept)
-        session.commit()
-    return dept
-
-def deadline_label(deadline):
-    today = date.today()
-    if deadline < today:
-        return "Quá hạn"
-    if deadline <= today + timedelta(days=3):
-        return "Sắp tới"
-    return "Đúng hạn"
-
 def style_deadline_row(row):
     color_map = {
         "Quá hạn": "background-color:#7f1d1d", 
@@ -42,6 +32,7 @@ def style_deadline_row(row):
     return [bg] * len(row)
 
 #  ADD DOCUMENT 
+profiling.checkpoint("form")
 st.subheader("➕ Thêm văn bản")
 
 with st.form("add_doc"):
@@ -51,82 +42,113 @@ with st.form("add_doc"):
         dept = st.text_input("Phòng ban")
     with c2:
         deadline = st.date_input("Deadline")
-        status = st.selectbox("Trạng thái", ["Đang xử lý", "Hoàn thành", "Tạm dừng"])
+        status = st.selectbox("Trạng thái", STATUSES)
 
     if st.form_submit_button("💾 Thêm"):
         if not name or not dept:
             st.error("❌ Thiếu thông tin")
             st.stop()
 
-        department = get_or_create_department(session, dept)
-        session.add(Document(
-            document_name=name,
-            department_id=department.department_id,
-            deadline=deadline,
-            status=status
-        ))
+        repo.add(name, dept, deadline, status)
         session.commit()
         st.success("✅ Đã thêm")
         st.rerun()
 
 #  LIST & EDIT 
+profiling.checkpoint("list")
 st.subheader("📋 Danh sách văn bản")
 
-docs = (
-    session.query(Document, Department)
-    .join(Department)
-    .order_by(Document.deadline)
-    .limit(st.session_state.edit_limit)
-    .all()
-)
-
-total = session.query(Document).count()
-
-late_exist = any(
-    d.deadline < date.today() and d.status != "Hoàn thành"
-    for d, _ in docs
-)
+def document_row(d, dept):
+    """Bản chụp một văn bản cho fragment"""
+    return {
+        "document_name": d.document_name,
+        "department_name": dept.department_name,
+        "deadline": d.deadline,
+        "status": d.status,
+    }
 
-if late_exist:
-    st.error("⚠️ Có văn bản quá hạn chưa xử lý!")
 
-def render_editor(d, dept):
-    with st.expander(f"📄 {d.document_name} | 🏢 {dept.department_name}"):
-        with st.form(f"edit_{d.document_id}"):
+def load_upcoming(limit):
+    """([(document_id, bản chụp)], còn văn bản quá hạn?)"""
+    with session_scope() as s:
+        docs = DocumentRepository(s).upcoming(limit)
+        return [(d.document_id, document_row(d, dept)) for d, dept in docs], has_overdue(docs)
+
+
+def load_count():
+    with session_scope() as s:
+        return DocumentRepository(s).count()
+
+
+# Ghi trong on_click (chạy trước thân fragment), rồi refresh(): bảng tổng
+# hợp và danh sách (cảnh báo quá hạn) bị đánh dấu cũ, trang chạy lại một
+# lần; tổng số văn bản không đổi nên được giữ
+def save_document(document_id):
+    state = st.session_state
+    with session_scope() as s:
+        docs_repo = DocumentRepository(s)
+        d = docs_repo.update(
+            docs_repo.get(document_id),
+            state[f"doc_name_{document_id}"],
+            state[f"doc_dept_{document_id}"],
+            state[f"doc_deadline_{document_id}"],
+            state[f"doc_status_{document_id}"],
+        )
+        s.flush()
+        row = document_row(d, d.department)
+    fragments.set_row_state("document_row", document_id, row)
+    fragments.refresh("docs_summary", "docs_list")
+    fragments.notify("document_row", document_id, "✅ Đã cập nhật")
+
+
+# Mỗi văn bản là một fragment: nhập liệu trong form chỉ chạy lại văn bản đó
+@st.fragment
+def render_editor(document_id, initial):
+    fragments.rerun_if_refreshed()
+    fragments.show_notice("document_row", document_id)
+    d = fragments.row_state("document_row", document_id, initial)
+    with st.expander(f"📄 {d['document_name']} | 🏢 {d['department_name']}"):
+        with st.form(f"edit_{document_id}"):
             c1, c2 = st.columns(2)
 
             with c1:
-                name = st.text_input("Tên văn bản", d.document_name)
-                deadline = st.date_input("Deadline", d.deadline)
+                st.text_input("Tên văn bản", d["document_name"], key=f"doc_name_{document_id}")
+                st.date_input("Deadline", d["deadline"], key=f"doc_deadline_{document_id}")
 
             with c2:
-                dept_name = st.text_input("Phòng ban", dept.department_name)
-                status = st.selectbox(
+                st.text_input("Phòng ban", d["department_name"], key=f"doc_dept_{document_id}")
+                st.selectbox(
                     "Trạng thái",
-                    ["Đang xử lý", "Hoàn thành", "Tạm dừng"],
-                    index=["Đang xử lý", "Hoàn thành", "Tạm dừng"].index(d.status)
+                    STATUSES,
+                    index=STATUSES.index(d["status"]),
+                    key=f"doc_status_{document_id}"
                 )
 
             col_save, col_del = st.columns(2)
 
-            if col_save.form_submit_button("💾 Lưu"):
-                department = get_or_create_department(session, dept_name)
-                d.document_name = name
-                d.deadline = deadline
-                d.status = status
-                d.department_id = department.department_id
-                session.commit()
-                st.success("✅ Đã cập nhật")
-                st.rerun()
+            col_save.form_submit_button(
+                "💾 Lưu", on_click=save_document, args=(document_id,)
+            )
 
             if col_del.form_submit_button("🗑️ Xoá"):
-                session.delete(d)
-                session.commit()
+                # Danh sách đổi cấu trúc: chạy lại cả trang
+                with session_scope() as s:
+                    docs_repo = DocumentRepository(s)
+                    docs_repo.delete(docs_repo.get(document_id))
                 st.warning("🗑️ Đã xoá")
                 st.rerun()
 
-for d, dept in docs:
-    render_editor(d, dept)
+docs, overdue = fragments.cached(
+    "docs_list", (st.session_state.edit_limit,),
+    lambda: load_upcoming(st.session_state.edit_limit)
+)
+total = fragments.cached("docs_count", (), load_count)
+
+if overdue:
+    st.error("⚠️ Có văn bản quá hạn chưa xử lý!")
+
+for document_id, row in docs:
+    render_editor(document_id, row)
 
 if st.session_state.edit_limit < total:
     if st.button("➕ Xem thêm"):
@@ -134,28 +156,55 @@ if st.session_state.edit_limit < total:
         st.rerun()
 
 #  SUMMARY TABLE 
+profiling.checkpoint("summary")
 st.subheader("📊 Tổng hợp tình trạng văn bản")
 
-data = session.query(Document, Department).join(Department).all()
-
-if not data:
-    st.info("Chưa có văn bản.")
-else:
-    df = pd.DataFrame([
-        {
-            "Tên văn bản": d.document_name,
-            "Phòng ban": dept.department_name,
-            "Deadline": d.deadline,
-            "Trạng thái": d.status,
-            "Nhãn trạng thái": deadline_label(d.deadline)
-        }
-        for d, dept in data
-    ])
-
-    df.index = range(1, len(df) + 1)
-
-    styled = df.style.apply(style_deadline_row, axis=1)
-
-    st.dataframe(styled, use_container_width=True)
-
+def load_summary(sort, descending, query, status, label, offset):
+    with session_scope() as s:
+        return DocumentRepository(s).summary_page(
+            sort, descending, query, list(status), list(label),
+            limit=tables.PAGE_SIZE, offset=offset
+        )
+
+
+# Bảng tổng hợp: lọc / sắp xếp chỉ chạy lại bảng, chỉ truy vấn lại khi
+# tham số đổi hoặc bị đánh dấu cũ
+@st.fragment
+def summary_view():
+    c1, c2, c3 = st.columns([3, 2, 2])
+    doc_query = c1.text_input(
+        "Lọc theo tên văn bản", key="docs_query",
+        on_change=tables.reset_page, args=("docs",)
+    )
+    doc_status = c2.multiselect(
+        "Trạng thái", STATUSES, key="docs_status",
+        on_change=tables.reset_page, args=("docs",)
+    )
+    doc_label = c3.multiselect(
+        "Nhãn trạng thái", LABELS, key="docs_label",
+        on_change=tables.reset_page, args=("docs",)
+    )
+    sort, descending = tables.sort_controls("docs", SUMMARY_COLUMNS, "Deadline")
+    offset = tables.page_offset("docs")
+    params = (sort, descending, doc_query, tuple(doc_status), tuple(doc_label), offset)
+    df, doc_rows = fragments.cached("docs_summary", params, lambda: load_summary(*params))
+
+    if not doc_rows:
+        st.info("Chưa có văn bản.")
+    else:
+        # Styler chỉ áp cho một trang nên chi phí cố định
+        styled = df.style.apply(style_deadline_row, axis=1)
+
+        st.dataframe(
+            styled,
+            width='stretch',
+            hide_index=True,
+            column_config={"Deadline": tables.date_column("Deadline")}
+        )
+    tables.page_footer("docs", doc_rows, label="văn bản")
+
+
+summary_view()
+
+profiling.finish_run()
 session.close()
@@ -0,0 +1,34 @@
+import streamlit as st
+from models import SessionLocal, init_db
+from search import search, SOURCE_LABELS
+import profiling
+
+# CONFIG
+st.set_page_config(page_title="🔎 Tìm kiếm", layout="wide")
+st.title("🔎 Tìm kiếm")
+profiling.start_run("Search")
+
+init_db()
+session = SessionLocal()
+
+query = st.text_input("Từ khoá (không cần gõ dấu)")
+sources = st.multiselect(
+    "Phạm vi",
+    list(SOURCE_LABELS),
+    format_func=lambda x: SOURCE_LABELS[x]
+)
+
+if query:
+    results = search(session, query, limit=100, sources=sources)
+
+    if not results:
+        st.info("Không tìm thấy kết quả.")
+    else:
+        st.caption(f"{len(results)} kết quả")
+        for r in results:
+            c1, c2 = st.columns([2, 8])
+            c1.markdown(SOURCE_LABELS[r["source"]])
+            c2.markdown(r["label"] or "")
+
+profiling.finish_run()
+session.close()
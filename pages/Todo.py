@@ -1,11 +1,18 @@
 import streamlit as st
 from datetime import date
-from models import SessionLocal, Todo
+from models import SessionLocal, init_db, session_scope
+import profiling
+import fragments
+from services.todos import TodoRepository, validate_task as check_task
 
 st.set_page_config(page_title="✅ Todo List", layout="wide")
 st.title("✅ Todo List")
+profiling.start_run("Todo")
 
+init_db()
 session = SessionLocal()
+repo = TodoRepository(session)
+fragments.start_page()
 
 # CSS để căn giữa checkbox
 st.markdown(
@@ -25,12 +32,13 @@ st.markdown(
 
 # validate task
 def validate_task(task: str):
-    if not task:
-        st.error("❌ Vui lòng nhập task")
-        return False
-    return True
+    valid, msg = check_task(task)
+    if not valid:
+        st.error(msg)
+    return valid
 
 # Thêm task mới
+profiling.checkpoint("form")
 st.subheader("➕ Thêm việc cần làm")
 with st.form("add_todo"):
     task_input = st.text_input("Việc cần làm")
@@ -38,7 +46,7 @@ with st.form("add_todo"):
     submit = st.form_submit_button("💾 Thêm task")
 
     if submit and validate_task(task_input):
-        session.add(Todo(task=task_input, due_date=due_input))
+        repo.add(task_input, due_input)
         session.commit()
         st.success("✅ Đã thêm task")
 
@@ -51,49 +59,55 @@ filter_date = st.date_input(
 )
 
 # Query task 
-todos = (
-    session.query(Todo)
-    .filter(Todo.due_date == filter_date)
-    .order_by(Todo.due_date)
-    .all()
-)
+profiling.checkpoint("load")
+todos = repo.for_date(filter_date)
 
 # Hiển thị danh sách task
+profiling.checkpoint("list")
 st.subheader("📋 Danh sách task")
 
+# Mỗi task là một fragment: tick / bỏ tick chỉ chạy lại đúng dòng đó
+@st.fragment
+def todo_item(todo_id, initial):
+    t = fragments.row_state("todo_row", todo_id, initial)
+    cols = st.columns([0.5, 5, 2])
+
+    # Checkbox hoàn thành
+    with cols[0]:
+        done = st.checkbox(
+            "Hoàn thành task",
+            value=t["is_done"],
+            key=f"check_{todo_id}",
+            label_visibility="collapsed"
+        )
+
+    # Update khi check/uncheck
+    if done != t["is_done"]:
+        with session_scope() as s:
+            todos_repo = TodoRepository(s)
+            todos_repo.set_done(todos_repo.get(todo_id), done)
+        t = {**t, "is_done": done}
+        fragments.set_row_state("todo_row", todo_id, t)
+
+    # Nội dung task
+    with cols[1]:
+        if done:
+            st.markdown(f"~~{t['task']}~~")
+        else:
+            st.markdown(t["task"])
+
+    # Ngày
+    with cols[2]:            
+        st.caption(f"📅 {t['due_date']}")
+
 if not todos:
     st.info("😴 Không có task nào cho ngày này")
 else:
     for t in todos:
-        cols = st.columns([0.5, 5, 2])
-
-        # Checkbox hoàn thành
-        with cols[0]:
-            done = st.checkbox(
-                "Hoàn thành task",
-                value=t.is_done,
-                key=f"check_{t.todo_id}",
-                label_visibility="collapsed"
-            )
-
-        # Nội dung task
-        with cols[1]:
-            if done:
-                st.markdown(f"~~{t.task}~~")
-            else:
-                st.markdown(t.task)
-
-        # Ngày
-        with cols[2]:            
-            st.caption(f"📅 {t.due_date}")
-
-        # Update khi check/uncheck
-        if done != t.is_done:
-            t.is_done = done
-            session.commit()
-            st.rerun()
+        todo_item(t.todo_id, {"task": t.task, "due_date": t.due_date, "is_done": t.is_done})
 
 # Xoá/sửa task
+profiling.checkpoint("edit")
 st.subheader("🤖 Quản lý task")
 todo_ids = [t.todo_id for t in todos]
 todo_dict = {t.todo_id: t.task for t in todos}  
@@ -103,11 +117,11 @@ selected_todo_id = st.selectbox(
     format_func=lambda x: todo_dict[x]
 )
 if selected_todo_id:
-    selected_todo = session.get(Todo, selected_todo_id)
+    selected_todo = repo.get(selected_todo_id)
 
     # Xoá task
     if st.button("🗑️ Xoá task"):
-        session.delete(selected_todo)
+        repo.delete(selected_todo)
         session.commit()
         st.rerun()
     # Sửa task
@@ -123,9 +137,9 @@ if selected_todo_id:
     edit_submit = st.button("💾 Lưu thay đổi")
 
     if edit_submit and validate_task(new_task_input):
-        selected_todo.task = new_task_input
-        selected_todo.due_date = new_due_input
+        repo.update(selected_todo, new_task_input, new_due_input)
         session.commit()
         st.rerun()
 
+profiling.finish_run()
 session.close()
\ No newline at end of file
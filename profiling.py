@@ -0,0 +1,238 @@
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event
+from models import BASE_DIR
+
+# Đo thời gian SQL và từng đoạn của script trang trong một lần rerun.
+#
+# Tắt mặc định: listener chỉ được gắn vào engine khi bật lần đầu, và khi
+# thread hiện tại không có run nào đang đo thì listener trả về ngay.
+
+LOG_PATH = os.path.join(BASE_DIR, "logs", "profile.jsonl")
+N_PLUS_ONE_THRESHOLD = 5
+
+_local = threading.local()
+_installed = set()
+_SECTION_START = "(bắt đầu)"
+
+
+def normalize_sql(statement):
+    """Gom các câu lệnh chỉ khác tham số: 'IN (?, ?, ?)' -> 'IN (?)'"""
+    statement = re.sub(r"\s+", " ", statement).strip()
+    statement = re.sub(r"\b\d+\b", "N", statement)
+    return re.sub(r"\?(\s*,\s*\?)+", "?", statement)
+
+
+class Section:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+
+class RunProfile:
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.finished = None
+        self.statements = []
+        self.sections = [Section(_SECTION_START)]
+        self.section_started = self.started
+        self.engine = None
+
+    @property
+    def current(self):
+        return self.sections[-1]
+
+    def checkpoint(self, name):
+        now = time.perf_counter()
+        self.current.seconds += now - self.section_started
+        self.sections.append(Section(name))
+        self.section_started = now
+
+    def record(self, statement, parameters, seconds, executemany):
+        self.statements.append({
+            "sql": normalize_sql(statement),
+            "raw": statement,
+            "params": None if executemany else parameters,
+            "seconds": seconds,
+            "section": self.current.name,
+        })
+        self.current.sql_count += 1
+        self.current.sql_seconds += seconds
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+            self.current.seconds += self.finished - self.section_started
+
+    def repeated_statements(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """Câu lệnh giống nhau lặp >= threshold lần trong một rerun (dấu hiệu N+1)"""
+        groups = {}
+        for s in self.statements:
+            g = groups.setdefault(s["sql"], {"sql": s["sql"], "count": 0, "seconds": 0.0})
+            g["count"] += 1
+            g["seconds"] += s["seconds"]
+        return sorted(
+            (g for g in groups.values() if g["count"] >= threshold),
+            key=lambda g: g["count"], reverse=True
+        )
+
+    def full_scans(self):
+        """EXPLAIN QUERY PLAN cho mỗi SELECT khác nhau, giữ lại các bước SCAN bảng"""
+        if self.engine is None:
+            return []
+
+        seen = {}
+        for s in self.statements:
+            head = s["raw"].lstrip()[:6].upper()
+            if head in ("SELECT", "WITH ") and s["sql"] not in seen:
+                seen[s["sql"]] = s
+
+        scans = []
+        previous, _local.run = getattr(_local, "run", None), None
+        try:
+            with self.engine.connect() as conn:
+                for sql, s in seen.items():
+                    try:
+                        plan = conn.exec_driver_sql(
+                            "EXPLAIN QUERY PLAN " + s["raw"], s["params"] or ()
+                        ).all()
+                    except Exception:
+                        continue
+                    steps = [
+                        row[-1] for row in plan
+                        if row[-1].startswith("SCAN") and "INDEX" not in row[-1]
+                    ]
+                    if steps:
+                        scans.append({"sql": sql, "plan": steps})
+        finally:
+            _local.run = previous
+        return scans
+
+    def to_dict(self):
+        self.finish()
+        return {
+            "page": self.page,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "total_ms": (self.finished - self.started) * 1000,
+            "sql_count": len(self.statements),
+            "sql_ms": sum(s["seconds"] for s in self.statements) * 1000,
+            "sections": [{
+                "name": sec.name,
+                "ms": sec.seconds * 1000,
+                "sql_count": sec.sql_count,
+                "sql_ms": sec.sql_seconds * 1000,
+            } for sec in self.sections if sec.seconds or sec.sql_count],
+            "n_plus_one": self.repeated_statements(),
+            "full_scans": self.full_scans(),
+        }
+
+
+# ENGINE EVENTS
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, "run", None) is None:
+        return
+    conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    run = getattr(_local, "run", None)
+    if run is None:
+        return
+    starts = conn.info.get("profile_start")
+    if not starts:
+        return
+    run.engine = run.engine or conn.engine
+    run.record(statement, parameters, time.perf_counter() - starts.pop(), executemany)
+
+
+def install(engine):
+    if id(engine) in _installed:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    _installed.add(id(engine))
+
+
+# API
+def begin(page, engine):
+    install(engine)
+    _local.run = RunProfile(page)
+    return _local.run
+
+
+def end():
+    run = getattr(_local, "run", None)
+    _local.run = None
+    if run is not None:
+        run.finish()
+    return run
+
+
+def checkpoint(name):
+    """Kết thúc đoạn hiện tại và bắt đầu đoạn `name` (không làm gì khi tắt)"""
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run.checkpoint(name)
+
+
+def write_log(report, path=LOG_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report, ensure_ascii=False, default=str) + "\n")
+
+
+# STREAMLIT
+def start_run(page):
+    """Gọi ngay sau st.set_page_config; bật bằng toggle ở sidebar hoặc APP_PROFILE=1"""
+    import streamlit as st
+    from models import engine
+
+    enabled = st.sidebar.toggle(
+        "🐞 Debug hiệu năng",
+        value=os.getenv("APP_PROFILE") == "1",
+        key="debug_profile"
+    )
+    if not enabled:
+        _local.run = None
+        return None
+    return begin(page, engine)
+
+
+def finish_run():
+    """Gọi ở cuối script trang: ghi log và hiển thị bảng debug ở sidebar"""
+    run = end()
+    if run is None:
+        return None
+
+    import pandas as pd
+    import streamlit as st
+
+    report = run.to_dict()
+    write_log(report)
+
+    with st.sidebar.expander("🐞 Hiệu năng lần chạy này", expanded=True):
+        c1, c2 = st.columns(2)
+        c1.metric("Tổng", f"{report['total_ms']:,.0f} ms")
+        c2.metric("SQL", f"{report['sql_count']} lệnh", f"{report['sql_ms']:,.0f} ms", delta_color="off")
+
+        st.dataframe(
+            pd.DataFrame(report["sections"]).rename(columns={
+                "name": "Đoạn", "ms": "ms", "sql_count": "SQL", "sql_ms": "SQL ms"
+            }),
+            hide_index=True,
+            width="stretch"
+        )
+
+        for g in report["n_plus_one"]:
+            st.warning(f"N+1? {g['count']} lần ({g['seconds'] * 1000:,.0f} ms): {g['sql'][:200]}")
+        for scan in report["full_scans"]:
+            st.info(f"Quét toàn bảng ({'; '.join(scan['plan'])}): {scan['sql'][:200]}")
+
+    return report
@@ -0,0 +1,223 @@
+import re
+import unicodedata
+from sqlalchemy import text
+
+# Chỉ mục tìm kiếm toàn văn (SQLite FTS5) cho nhà cung cấp, sản phẩm,
+# văn bản, task, danh mục chi tiêu và lịch sử hỏi đáp.
+#
+# Mỗi dòng nguồn có đúng một dòng trong chỉ mục với rowid = id * 8 + code,
+# nên trigger cập nhật/xoá chỉ đụng tới một rowid (không quét bảng).
+#
+# Trigger chỉ dùng hàm có sẵn của SQLite để ghi từ sqlite3 CLI hay công cụ
+# khác vẫn chạy: tokenizer unicode61 remove_diacritics 2 đã bỏ dấu và viết
+# thường, trigger chỉ cần đổi đ/Đ (chữ riêng, không phải dấu) thành d/D.
+#
+# Cột source cũng được đánh chỉ mục để lọc nguồn nằm trong MATCH: FTS5 giao
+# hai doclist bằng seek thay vì duyệt mọi dòng khớp rồi lọc.
+
+INDEX_TABLE = "search_index"
+
+# (code, bảng, khoá chính, biểu thức nội dung, biểu thức nhãn hiển thị)
+SOURCES = [
+    (1, "suppliers", "supplier_id", "{r}.supplier_name", "{r}.supplier_name"),
+    (2, "products", "product_id", "{r}.product_name", "{r}.product_name"),
+    (3, "documents", "document_id", "{r}.document_name", "{r}.document_name"),
+    (4, "todos", "todo_id", "{r}.task", "{r}.task"),
+    (5, "transactions", "transaction_id", "{r}.category", "{r}.category"),
+    (6, "chat_history", "id",
+     "COALESCE({r}.question, '') || ' ' || COALESCE({r}.answer, '')",
+     "{r}.question"),
+]
+
+SOURCE_LABELS = {
+    "suppliers": "🏭 Nhà cung cấp",
+    "products": "📦 Sản phẩm",
+    "documents": "📄 Văn bản",
+    "todos": "✅ Công việc",
+    "transactions": "💰 Chi tiêu",
+    "chat_history": "🤖 Hỏi đáp AI",
+}
+
+ROWID_STRIDE = 8
+# Số dòng khớp tối đa được xếp hạng cho một truy vấn
+CANDIDATES = 2_000
+
+
+def normalize_text(value):
+    """Bỏ dấu tiếng Việt và viết thường: 'Đường Sữa' -> 'duong sua'"""
+    if value is None:
+        return ""
+    value = str(value).replace("đ", "d").replace("Đ", "D")
+    value = unicodedata.normalize("NFD", value)
+    value = "".join(ch for ch in value if unicodedata.category(ch) != "Mn")
+    return value.lower()
+
+
+def register_functions(dbapi_connection, connection_record=None):
+    # unaccent() cho bộ lọc LIKE của các bảng tổng hợp; chỉ có trên connection
+    # của app (create_app_engine), trigger không dùng tới
+    dbapi_connection.create_function(
+        "unaccent", 1, normalize_text, deterministic=True
+    )
+
+
+def _fold(expr):
+    """Biểu thức SQL của nội dung đưa vào chỉ mục (phần còn lại do tokenizer)"""
+    return f"replace(replace({expr}, 'đ', 'd'), 'Đ', 'D')"
+
+
+def _trigger_sql(code, table, pk, body_expr, label_expr):
+    def insert_row(r):
+        return (
+            f"INSERT INTO {INDEX_TABLE}(rowid, body, label, source, ref_id) "
+            f"VALUES ({r}.{pk} * {ROWID_STRIDE} + {code}, "
+            f"{_fold(body_expr.format(r=r))}, {label_expr.format(r=r)}, "
+            f"'{table}', {r}.{pk});"
+        )
+
+    def delete_row(r):
+        return (
+            f"DELETE FROM {INDEX_TABLE} "
+            f"WHERE rowid = {r}.{pk} * {ROWID_STRIDE} + {code};"
+        )
+
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {INDEX_TABLE}_{table}_ai "
+        f"AFTER INSERT ON {table} BEGIN {insert_row('NEW')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {INDEX_TABLE}_{table}_au "
+        f"AFTER UPDATE ON {table} BEGIN {delete_row('OLD')} {insert_row('NEW')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {INDEX_TABLE}_{table}_ad "
+        f"AFTER DELETE ON {table} BEGIN {delete_row('OLD')} END",
+    ]
+
+
+def _index_sql(code, table, pk, body_expr, label_expr, source=None):
+    """INSERT các dòng của bảng nguồn (hoặc bản lưu trữ source của nó)"""
+    return (
+        f"INSERT INTO {INDEX_TABLE}(rowid, body, label, source, ref_id) "
+        f"SELECT t.{pk} * {ROWID_STRIDE} + {code}, "
+        f"{_fold(body_expr.format(r='t'))}, {label_expr.format(r='t')}, "
+        f"'{table}', t.{pk} FROM {source or table} t"
+    )
+
+
+def _archived(conn, schema):
+    """Các nguồn có bảng cùng tên trong DB lưu trữ schema"""
+    if schema is None:
+        return []
+    names = set(conn.execute(
+        text(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'")
+    ).scalars())
+    return [source for source in SOURCES if source[1] in names]
+
+
+def rebuild_index(conn, archive=None):
+    """Xây lại toàn bộ chỉ mục từ các bảng nguồn (và bản lưu trữ của chúng)"""
+    conn.execute(text(f"DELETE FROM {INDEX_TABLE}"))
+    for source in SOURCES:
+        conn.execute(text(_index_sql(*source)))
+    # Dòng chuyển dở còn ở cả hai file đã có trong chỉ mục từ bảng nóng
+    for code, table, pk, body_expr, label_expr in _archived(conn, archive):
+        conn.execute(text(
+            _index_sql(code, table, pk, body_expr, label_expr, f"{archive}.{table}")
+            + f" WHERE t.{pk} NOT IN (SELECT {pk} FROM main.{table})"
+        ))
+
+
+def index_archived(conn, table, ids, archive):
+    """Dòng vừa chuyển sang archive: trigger xoá của bảng nóng đã bỏ dòng chỉ
+    mục (rowid giữ nguyên vì id không bị dùng lại), thêm lại từ bản lưu trữ"""
+    for code, name, pk, body_expr, label_expr in SOURCES:
+        if name == table and ids:
+            conn.execute(text(
+                _index_sql(code, name, pk, body_expr, label_expr, f"{archive}.{name}")
+                + f" WHERE t.{pk} IN ({', '.join(str(int(i)) for i in ids)})"
+            ))
+
+
+def init_search(engine, archive=None):
+    with engine.begin() as conn:
+        existing = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :n"),
+            {"n": INDEX_TABLE}
+        ).scalar()
+        # Chỉ mục cũ: source UNINDEXED
+        if existing and "source UNINDEXED" in existing:
+            conn.execute(text(f"DROP TABLE {INDEX_TABLE}"))
+            existing = None
+
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+            "body, label UNINDEXED, source, ref_id UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+        for source in SOURCES:
+            for ddl in _trigger_sql(*source):
+                conn.execute(text(ddl))
+
+        # DB cũ đã có dữ liệu trước khi có chỉ mục
+        if existing is None:
+            rebuild_index(conn, archive)
+            return
+
+        # Bản cũ của services.archive làm mất dòng chỉ mục của các dòng đã
+        # chuyển; còn dòng chuyển có id lớn nhất thì không thiếu dòng nào
+        for code, table, pk, body_expr, label_expr in _archived(conn, archive):
+            def missing(ref):
+                return (
+                    f"NOT EXISTS (SELECT 1 FROM {INDEX_TABLE} "
+                    f"WHERE rowid = {ref} * {ROWID_STRIDE} + {code})"
+                )
+
+            last = conn.execute(text(f"SELECT max({pk}) FROM {archive}.{table}")).scalar()
+            if last is not None and conn.execute(text(f"SELECT {missing(int(last))}")).scalar():
+                conn.execute(text(
+                    _index_sql(code, table, pk, body_expr, label_expr, f"{archive}.{table}")
+                    + f" WHERE {missing('t.' + pk)}"
+                ))
+
+
+def build_match_query(query):
+    """'sữa tươi' -> '"sua" "tuoi"*': chỉ từ cuối khớp tiền tố (đang gõ dở);
+    tiền tố ở mọi từ làm mỗi từ nở thành rất nhiều token"""
+    terms = re.findall(r"\w+", normalize_text(query))
+    if not terms:
+        return ""
+    return " ".join([f'"{t}"' for t in terms[:-1]] + [f'"{terms[-1]}"*'])
+
+
+def search(session, query, limit=50, sources=None):
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    match = f"body : ({match})"
+    if sources:
+        match += " AND source : (" + " OR ".join(f'"{s}"' for s in sources) + ")"
+    where = f"{INDEX_TABLE} MATCH :match"
+    params = {"match": match, "limit": limit}
+
+    # bm25 cần số dòng chứa từng từ trên toàn chỉ mục nên tốn tỉ lệ với số
+    # dòng khớp. Từ phổ biến (>= CANDIDATES dòng khớp): chỉ xét CANDIDATES
+    # dòng mới nhất (duyệt rowid giảm dần, không chấm điểm) và xếp theo độ
+    # dài nội dung – với từ phổ biến bm25 cũng gần như chỉ còn phụ thuộc vào đó.
+    threshold = session.execute(text(
+        f"SELECT rowid FROM {INDEX_TABLE} WHERE {where} "
+        "ORDER BY rowid DESC LIMIT 1 OFFSET :offset"
+    ), {**params, "offset": CANDIDATES - 1}).scalar()
+
+    if threshold is None:
+        sql = (
+            f"SELECT source, ref_id, label, "
+            f"bm25({INDEX_TABLE}, 1, 0, 0, 0) AS score "
+            f"FROM {INDEX_TABLE} WHERE {where} ORDER BY score LIMIT :limit"
+        )
+    else:
+        sql = (
+            f"SELECT source, ref_id, label, length(body) AS score "
+            f"FROM {INDEX_TABLE} WHERE {where} AND rowid >= :threshold "
+            "ORDER BY length(body), rowid DESC LIMIT :limit"
+        )
+        params["threshold"] = threshold
+
+    return session.execute(text(sql), params).mappings().all()
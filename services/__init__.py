@@ -0,0 +1,14 @@
+"""Logic nghiệp vụ dùng chung cho các trang Streamlit, batch job và benchmark.
+
+Không module nào trong package này import streamlit: hàm thuần nhận giá trị
+và trả về giá trị, repository nhận một Session và không tự commit.
+"""
+from services.invoices import (
+    InvoiceRepository, calculate, validate_invoice, to_date
+)
+from services.documents import DocumentRepository, deadline_label, STATUSES
+from services.todos import TodoRepository, validate_task
+from services.finance import (
+    TransactionRepository, ChatRepository, build_financial_context,
+    monthly_summary, yearly_summary
+)
@@ -0,0 +1,150 @@
+import argparse
+from datetime import date, datetime
+from sqlalchemy import delete, func, insert, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased
+import search
+from models import (
+    ARCHIVE_SCHEMA, Invoice, Payment, Personal_Spending, ArchivedInvoice,
+    ArchivedPayment, ArchivedTransaction, ArchivePending, session_scope
+)
+
+KEEP_MONTHS = 12
+# Số id mỗi lệnh khi xoá dòng con / thêm lại chỉ mục tìm kiếm
+CHUNK = 500
+
+# Bảng nóng chỉ giữ dữ liệu đang dùng; các truy vấn mặc định không đụng tới
+# archive. Khi người dùng chọn xem lịch sử / xuất toàn bộ, dùng entity
+# UNION ALL dưới đây thay cho Invoice / Personal_Spending.
+
+
+def _with_archive(model, archived):
+    hot = model.__table__
+    union = union_all(
+        select(*hot.columns),
+        select(*[archived.c[c.name] for c in hot.columns]),
+    ).subquery(f"{hot.name}_all")
+    return aliased(model, union)
+
+
+def invoice_source(include_archive=False):
+    return _with_archive(Invoice, ArchivedInvoice) if include_archive else Invoice
+
+
+def transaction_source(include_archive=False):
+    if include_archive:
+        return _with_archive(Personal_Spending, ArchivedTransaction)
+    return Personal_Spending
+
+
+def _move(session, model, archived, condition, children=()):
+    """Chuyển dòng thoả condition sang archive. Commit riêng từng file
+    (archive trước) để dừng giữa chừng chỉ để lại dòng ở cả hai file, không
+    mất dòng; models.reconcile_archive dọn phần trùng theo dấu pending_moves
+    (khi dấu cũ hơn MOVE_TIMEOUT).
+    children: (bảng con, bản lưu trữ, cột khoá ngoại) chuyển cùng dòng cha.
+    Chạy lại sau khi bị dừng vẫn đúng."""
+    table = model.__table__
+    pk = table.primary_key.columns[0]
+    copy = archived.c[pk.name]
+    # Cùng tên bảng với main nên cần alias để tương quan
+    saved = archived.alias("saved").c[pk.name]
+    # Không chuyển dòng có id lớn nhất: SQLite cấp id = max + 1 nên nếu xoá
+    # dòng đó, id có thể bị dùng lại và trùng với bản trong archive.
+    condition = condition & (pk < select(func.max(pk)).scalar_subquery())
+
+    ids = select(pk).where(condition)
+
+    for name in [table.name] + [child.name for child, _, _ in children]:
+        marker = sqlite_insert(ArchivePending).values(
+            table_name=name, started_at=datetime.utcnow()
+        )
+        session.execute(marker.on_conflict_do_update(
+            index_elements=["table_name"], set_={"started_at": marker.excluded.started_at}
+        ))
+    # Bản cũ còn sót của lần trước được thay bằng bản nóng hiện tại
+    session.execute(delete(archived).where(copy.in_(ids)))
+    session.execute(
+        insert(archived).from_select(
+            [c.name for c in table.columns],
+            select(*table.columns).where(pk.in_(ids))
+        )
+    )
+    for child, child_archived, fk in children:
+        session.execute(delete(child_archived).where(child_archived.c[fk].in_(ids)))
+        session.execute(
+            insert(child_archived).from_select(
+                [c.name for c in child.columns],
+                select(*child.columns).where(child.c[fk].in_(ids))
+            )
+        )
+    session.commit()
+    # Chỉ xoá dòng đã có bản trong archive: nếu reconcile_archive chạy xen
+    # giữa và xoá bản sao thì dòng ở lại main
+    moved = session.execute(
+        delete(table)
+        .where(pk.in_(ids), select(saved).where(saved == pk).exists())
+        .returning(pk)
+    ).scalars().all()
+    for start in range(0, len(moved), CHUNK):
+        chunk = moved[start:start + CHUNK]
+        # Dòng con xoá sau dòng cha nên trigger ledger không sửa gì; dòng con
+        # thêm sau lúc chép (chưa có bản lưu trữ) ở lại main
+        for child, child_archived, fk in children:
+            child_pk = child.primary_key.columns[0]
+            child_saved = child_archived.alias("saved").c[child_pk.name]
+            session.execute(delete(child).where(
+                child.c[fk].in_(chunk),
+                select(child_saved).where(child_saved == child_pk).exists()
+            ))
+        search.index_archived(session, table.name, chunk, ARCHIVE_SCHEMA)
+    session.commit()
+    session.execute(delete(ArchivePending).where(ArchivePending.c.table_name.in_(
+        [table.name] + [child.name for child, _, _ in children]
+    )))
+    session.commit()
+    return len(moved)
+
+
+def archive_invoices(session, before):
+    """Chuyển hoá đơn đã trả đủ có tháng < before sang archive"""
+    return _move(
+        session, Invoice, ArchivedInvoice,
+        (Invoice.total_debt == 0) & (Invoice.invoice_month < before.isoformat()),
+        children=[(Payment.__table__, ArchivedPayment, "invoice_id")]
+    )
+
+
+def archive_transactions(session, year):
+    """Chuyển giao dịch của các năm < year (đã đóng sổ) sang archive"""
+    return _move(
+        session, Personal_Spending, ArchivedTransaction,
+        Personal_Spending.transaction_date < date(year, 1, 1)
+    )
+
+
+def archive_old_data(session, today=None, keep_months=KEEP_MONTHS):
+    today = today or date.today()
+    months = today.year * 12 + today.month - 1 - keep_months
+    before = date(months // 12, months % 12 + 1, 1)
+    return {
+        "invoices": archive_invoices(session, before),
+        "transactions": archive_transactions(session, today.year),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chuyển dữ liệu cũ sang DB lưu trữ")
+    parser.add_argument("--keep-months", type=int, default=KEEP_MONTHS,
+                        help="Giữ lại hoá đơn đã trả đủ của N tháng gần nhất")
+    args = parser.parse_args(argv)
+
+    from models import init_db
+    init_db()
+    with session_scope() as session:
+        moved = archive_old_data(session, keep_months=args.keep_months)
+    print(f"Đã lưu trữ {moved['invoices']} hoá đơn, {moved['transactions']} giao dịch")
+
+
+if __name__ == "__main__":
+    main()
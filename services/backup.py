@@ -0,0 +1,355 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from urllib.parse import quote
+from models import (
+    ARCHIVE_SCHEMA, DB_PATH, ArchivedInvoice, ArchivedPayment, ArchivedTransaction,
+    ArchivePending, archive_path, create_app_engine, reconcile_archive
+)
+
+# Sao lưu trực tuyến database/app.db (và app_archive.db) bằng backup API.
+#
+# - Nguồn phải ở chế độ WAL (snapshot() tự chuyển một lần, chế độ này lưu
+#   trong file). Một read transaction mở suốt quá trình copy giữ ảnh chụp
+#   tại một thời điểm: người khác vẫn ghi vào WAL, backup không bị khởi động
+#   lại và không giữ khoá ghi. Ở chế độ journal cũ thì hoặc chặn người ghi
+#   suốt lúc copy, hoặc backup bị khởi động lại sau mỗi lần ghi.
+# - Copy theo từng lô PAGES trang, nghỉ PAUSE giây giữa hai lô để không
+#   chiếm hết đĩa của app.
+# - Mỗi snapshot là một thư mục BACKUP_DIR/app-YYYYmmdd-HHMMSS gồm các file
+#   DB (journal_mode=DELETE, tự đứng được) và manifest.json. Thư mục được ghi
+#   dưới tên tạm và chỉ đổi tên sau khi PRAGMA integrity_check trả về ok.
+# - Snapshot theo lịch bỏ qua khi DB không đổi từ snapshot trước, rồi xoá
+#   bản cũ theo KEEP_LAST / KEEP_DAILY.
+# - WAL làm transaction ghi cả main và archive chỉ nguyên tử trong từng file,
+#   và read transaction của hai file trong snapshot cũng bắt đầu lần lượt
+#   (main trước). services.archive ghi archive rồi mới xoá khỏi main nên cả
+#   hai trường hợp chỉ có thể để lại dòng ở cả hai file, không mất dòng;
+#   models.reconcile_archive dọn phần trùng (lúc khởi động app, và toàn bộ
+#   khi restore).
+
+BACKUP_DIR = os.path.join(os.path.dirname(DB_PATH), "backups")
+PAGES = 1024
+PAUSE = 0.005
+KEEP_LAST = 24
+KEEP_DAILY = 7
+MANIFEST = "manifest.json"
+_PREFIX = "app-"
+_PARTIAL = ".partial"
+
+
+class BackupError(Exception):
+    pass
+
+
+def _connect(path):
+    return sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+
+
+def _read_only(path):
+    """URI chỉ đọc: connection này không checkpoint / xoá WAL khi đóng nên
+    không làm đổi file nguồn"""
+    return f"file:{quote(os.path.abspath(path))}?mode=ro"
+
+
+def _connect_read_only(path):
+    return sqlite3.connect(
+        _read_only(path), uri=True, isolation_level=None, check_same_thread=False
+    )
+
+
+def ensure_wal(path=DB_PATH):
+    """Chuyển DB (và archive nếu có) sang WAL; trả về journal_mode trước đó"""
+    databases = [p for p in (path, archive_path(path)) if os.path.exists(p)]
+    modes = []
+    for db in databases:
+        conn = _connect_read_only(db)
+        try:
+            modes.append(conn.execute("PRAGMA journal_mode").fetchone()[0])
+        finally:
+            conn.close()
+    if all(mode == "wal" for mode in modes):
+        return "wal"
+
+    conn = _connect(path)
+    try:
+        before = modes[0]
+        if os.path.exists(archive_path(path)):
+            conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_path(path),))
+            conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.journal_mode = WAL")
+        mode = conn.execute("PRAGMA main.journal_mode = WAL").fetchone()[0]
+    finally:
+        conn.close()
+    if mode != "wal":
+        raise BackupError(f"Không chuyển được {path} sang WAL (đang {mode})")
+    return before
+
+
+def fingerprint(path=DB_PATH):
+    """Kích thước + mtime của file DB và WAL: khác nhau nghĩa là có thể đã ghi.
+    WAL rỗng (còn lại sau checkpoint) không tính"""
+    stats = {}
+    for db in (path, archive_path(path)):
+        for f in (db, db + "-wal"):
+            if os.path.exists(f) and os.path.getsize(f):
+                st = os.stat(f)
+                stats[os.path.basename(f)] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def integrity_check(path):
+    """Danh sách thông báo của PRAGMA integrity_check, ["ok"] nếu file lành"""
+    conn = _connect_read_only(path)
+    try:
+        return [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+
+
+def _copy(src, schema, target, pages, pause, progress):
+    dst = _connect(target)
+    try:
+        def step(status, remaining, total):
+            if progress:
+                progress(schema, total - remaining, total)
+            if pause and remaining:
+                time.sleep(pause)
+
+        src.backup(dst, pages=pages, name=schema, progress=step)
+        # Bản sao tự đứng được, không cần file -wal / -shm đi kèm
+        dst.execute("PRAGMA journal_mode = DELETE")
+        return dst.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        dst.close()
+
+
+def _write_manifest(folder, manifest):
+    with open(os.path.join(folder, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def read_manifest(folder):
+    with open(os.path.join(folder, MANIFEST), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def snapshot(path=DB_PATH, backup_dir=BACKUP_DIR, pages=PAGES, pause=PAUSE,
+             progress=None, now=None):
+    """Tạo một snapshot của DB đang chạy; trả về đường dẫn thư mục snapshot"""
+    now = now or datetime.now()
+    ensure_wal(path)
+    folder = os.path.join(backup_dir, f"{_PREFIX}{now:%Y%m%d-%H%M%S}")
+    if os.path.exists(folder):
+        raise BackupError(f"Snapshot {os.path.basename(folder)} đã tồn tại")
+    partial = folder + _PARTIAL
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+
+    schemas = {"main": os.path.basename(path)}
+    has_archive = os.path.exists(archive_path(path))
+    if has_archive:
+        schemas[ARCHIVE_SCHEMA] = os.path.basename(archive_path(path))
+
+    start = time.perf_counter()
+    files = {}
+    try:
+        src = _connect_read_only(path)
+        try:
+            if has_archive:
+                src.execute(
+                    f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (_read_only(archive_path(path)),)
+                )
+            # Mở read transaction trên cả hai DB trước khi copy: mọi lô đọc
+            # cùng một ảnh chụp, lần ghi của người khác không làm backup chạy
+            # lại. Main phải đọc trước archive: dòng đã xoá khỏi main trước
+            # ảnh chụp của main chắc chắn đã có trong ảnh chụp của archive
+            source_fingerprint = fingerprint(path)
+            src.execute("BEGIN")
+            for schema in schemas:
+                src.execute(f"SELECT count(*) FROM {schema}.sqlite_master").fetchone()
+
+            for schema, name in schemas.items():
+                target = os.path.join(partial, name)
+                page_count = _copy(src, schema, target, pages, pause, progress)
+                files[name] = {"pages": page_count, "bytes": os.path.getsize(target)}
+            src.execute("COMMIT")
+        finally:
+            src.close()
+
+        for name in files:
+            result = integrity_check(os.path.join(partial, name))
+            if result != ["ok"]:
+                raise BackupError(f"{name}: integrity_check lỗi: {'; '.join(result[:5])}")
+
+        _write_manifest(partial, {
+            "created_at": now.isoformat(timespec="seconds"),
+            "source": os.path.abspath(path),
+            "fingerprint": source_fingerprint,
+            "files": files,
+            "integrity": "ok",
+            "duration_s": round(time.perf_counter() - start, 3),
+        })
+        os.replace(partial, folder)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    return folder
+
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    """Manifest của các snapshot hoàn chỉnh, mới nhất trước"""
+    if not os.path.isdir(backup_dir):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(backup_dir), reverse=True):
+        folder = os.path.join(backup_dir, name)
+        if not name.startswith(_PREFIX) or name.endswith(_PARTIAL):
+            continue
+        if not os.path.exists(os.path.join(folder, MANIFEST)):
+            continue
+        snapshots.append({"name": name, "path": folder, **read_manifest(folder)})
+    return snapshots
+
+
+def prune(backup_dir=BACKUP_DIR, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY):
+    """Giữ keep_last snapshot mới nhất và bản mới nhất của keep_daily ngày
+    gần nhất; xoá phần còn lại. Trả về tên các snapshot đã xoá"""
+    snapshots = list_snapshots(backup_dir)
+    keep = {s["name"] for s in snapshots[:keep_last]}
+    days = []
+    for s in snapshots:
+        day = s["created_at"][:10]
+        if day not in days:
+            days.append(day)
+            if len(days) <= keep_daily:
+                keep.add(s["name"])
+
+    removed = []
+    for s in snapshots:
+        if s["name"] not in keep:
+            shutil.rmtree(s["path"])
+            removed.append(s["name"])
+    return removed
+
+
+def scheduled_snapshot(path=DB_PATH, backup_dir=BACKUP_DIR, keep_last=KEEP_LAST,
+                       keep_daily=KEEP_DAILY, **kwargs):
+    """Một lượt theo lịch: snapshot nếu DB đã đổi, rồi dọn bản cũ.
+    Trả về (thư mục snapshot hoặc None, tên các bản đã xoá)"""
+    latest = next(iter(list_snapshots(backup_dir)), None)
+    folder = None
+    if latest is None or latest.get("fingerprint") != fingerprint(path):
+        folder = snapshot(path, backup_dir, **kwargs)
+    return folder, prune(backup_dir, keep_last, keep_daily)
+
+
+def restore(folder, target, pages=PAGES):
+    """Khôi phục snapshot vào file mới target (và archive cạnh nó).
+    Không ghi đè file có sẵn: dừng app rồi đổi tên file khi muốn dùng bản này"""
+    manifest = read_manifest(folder)
+    main_name = os.path.basename(manifest["source"])
+    targets = {main_name: target}
+    for name in manifest["files"]:
+        if name != main_name:
+            targets[name] = archive_path(target)
+
+    for path in targets.values():
+        if os.path.exists(path):
+            raise FileExistsError(f"{path} đã tồn tại, hãy chọn file mới")
+
+    written = []
+    try:
+        for name, path in targets.items():
+            partial = path + _PARTIAL
+            src = _connect_read_only(os.path.join(folder, name))
+            try:
+                _copy(src, "main", partial, pages, 0, None)
+            finally:
+                src.close()
+            written.append(partial)
+            result = integrity_check(partial)
+            if result != ["ok"]:
+                raise BackupError(f"{name}: integrity_check lỗi: {'; '.join(result[:5])}")
+        for name, path in targets.items():
+            os.replace(path + _PARTIAL, path)
+    except BaseException:
+        for partial in written:
+            if os.path.exists(partial):
+                os.remove(partial)
+        raise
+
+    # Snapshot có thể chứa dòng ở cả hai file (xem đầu file)
+    if len(targets) > 1:
+        engine = create_app_engine(target)
+        try:
+            # Snapshot cũ có thể chưa có bảng dấu / bảng thanh toán lưu trữ
+            ArchivePending.create(engine, checkfirst=True)
+            ArchivedPayment.create(engine, checkfirst=True)
+            reconcile_archive(engine, [
+                t.name for t in (ArchivedInvoice, ArchivedPayment, ArchivedTransaction)
+            ])
+        finally:
+            engine.dispose()
+    return list(targets.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sao lưu / khôi phục database của app")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--dir", default=BACKUP_DIR, help="Thư mục chứa snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("snapshot", help="Tạo snapshot ngay")
+    schedule = sub.add_parser("schedule", help="Snapshot định kỳ (bỏ qua khi DB không đổi)")
+    schedule.add_argument("--every", type=float, default=3600, help="Giây giữa hai lượt")
+    schedule.add_argument("--once", action="store_true", help="Chạy một lượt rồi thoát (cho cron)")
+    for p in (schedule, sub.add_parser("prune", help="Xoá snapshot cũ")):
+        p.add_argument("--keep-last", type=int, default=KEEP_LAST)
+        p.add_argument("--keep-daily", type=int, default=KEEP_DAILY)
+    sub.add_parser("list", help="Liệt kê snapshot")
+    verify = sub.add_parser("verify", help="Chạy integrity_check trên một snapshot")
+    verify.add_argument("name")
+    restore_cmd = sub.add_parser("restore", help="Khôi phục snapshot vào file DB mới")
+    restore_cmd.add_argument("name")
+    restore_cmd.add_argument("target")
+    args = parser.parse_args(argv)
+
+    if args.command == "snapshot":
+        print(f"Đã tạo {snapshot(args.db, args.dir)}")
+    elif args.command == "schedule":
+        while True:
+            folder, removed = scheduled_snapshot(
+                args.db, args.dir, args.keep_last, args.keep_daily
+            )
+            print(f"{datetime.now():%Y-%m-%d %H:%M:%S} "
+                  f"{folder or 'DB không đổi, bỏ qua'} · xoá {len(removed)} bản cũ", flush=True)
+            if args.once:
+                break
+            time.sleep(args.every)
+    elif args.command == "prune":
+        removed = prune(args.dir, args.keep_last, args.keep_daily)
+        print(f"Đã xoá {len(removed)} snapshot: {', '.join(removed)}")
+    elif args.command == "list":
+        for s in list_snapshots(args.dir):
+            size = sum(f["bytes"] for f in s["files"].values()) / 1024 / 1024
+            print(f"{s['name']}  {s['created_at']}  {size:,.1f} MB  {s['integrity']}")
+    elif args.command == "verify":
+        folder = os.path.join(args.dir, args.name)
+        failed = 0
+        for name in read_manifest(folder)["files"]:
+            result = integrity_check(os.path.join(folder, name))
+            failed += result != ["ok"]
+            print(f"{name}: {'; '.join(result[:5])}")
+        return 1 if failed else 0
+    elif args.command == "restore":
+        for path in restore(os.path.join(args.dir, args.name), args.target):
+            print(f"Đã khôi phục {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,125 @@
+import pandas as pd
+from datetime import date, timedelta
+from sqlalchemy import case, func, select
+from models import Document, Department
+from search import normalize_text
+
+STATUSES = ["Đang xử lý", "Hoàn thành", "Tạm dừng"]
+LABELS = ["Quá hạn", "Sắp tới", "Đúng hạn"]
+SUMMARY_COLUMNS = ["Tên văn bản", "Phòng ban", "Deadline", "Trạng thái", "Nhãn trạng thái"]
+
+
+# HELPERS
+def deadline_label(deadline, today=None):
+    today = today or date.today()
+    if deadline < today:
+        return "Quá hạn"
+    if deadline <= today + timedelta(days=3):
+        return "Sắp tới"
+    return "Đúng hạn"
+
+
+def has_overdue(docs, today=None):
+    today = today or date.today()
+    return any(
+        d.deadline < today and d.status != "Hoàn thành"
+        for d, _ in docs
+    )
+
+
+# REPOSITORY
+class DocumentRepository:
+    def __init__(self, session):
+        self.session = session
+
+    def get_or_create_department(self, name: str):
+        name = name.strip()
+        dept = self.session.query(Department).filter_by(department_name=name).first()
+        if not dept:
+            dept = Department(department_name=name)
+            self.session.add(dept)
+            self.session.flush()
+        return dept
+
+    def add(self, name, dept_name, deadline, status):
+        department = self.get_or_create_department(dept_name)
+        doc = Document(
+            document_name=name,
+            department_id=department.department_id,
+            deadline=deadline,
+            status=status
+        )
+        self.session.add(doc)
+        return doc
+
+    def update(self, doc, name, dept_name, deadline, status):
+        department = self.get_or_create_department(dept_name)
+        doc.document_name = name
+        doc.deadline = deadline
+        doc.status = status
+        doc.department_id = department.department_id
+        return doc
+
+    def delete(self, doc):
+        self.session.delete(doc)
+
+    def get(self, document_id):
+        return self.session.get(Document, document_id)
+
+    def count(self):
+        return self.session.query(Document).count()
+
+    def upcoming(self, limit):
+        return (
+            self.session.query(Document, Department)
+            .join(Department)
+            .order_by(Document.deadline)
+            .limit(limit)
+            .all()
+        )
+
+    def all_with_departments(self):
+        return self.session.query(Document, Department).join(Department).all()
+
+    def summary_page(self, sort="Deadline", descending=False, query=None,
+                     status=None, label=None, today=None, limit=50, offset=0):
+        """Một trang bảng tổng hợp văn bản; nhãn deadline tính bằng CASE trong
+        SQL (cùng quy tắc với deadline_label) nên lọc / sắp xếp được.
+        Trả về (DataFrame, tổng số dòng khớp bộ lọc)."""
+        today = today or date.today()
+        deadline_case = case(
+            (Document.deadline < today, LABELS[0]),
+            (Document.deadline <= today + timedelta(days=3), LABELS[1]),
+            else_=LABELS[2]
+        )
+        columns = {
+            "Tên văn bản": Document.document_name,
+            "Phòng ban": Department.department_name,
+            "Deadline": Document.deadline,
+            "Trạng thái": Document.status,
+            "Nhãn trạng thái": Document.deadline,
+        }
+        stmt = select(
+            Document.document_name,
+            Department.department_name,
+            Document.deadline,
+            Document.status,
+            deadline_case,
+            func.count().over(),
+        ).join_from(Document, Department)
+        if query:
+            stmt = stmt.where(
+                func.unaccent(Document.document_name)
+                .contains(normalize_text(query).strip(), autoescape=True)
+            )
+        if status:
+            stmt = stmt.where(Document.status.in_(status))
+        if label:
+            stmt = stmt.where(deadline_case.in_(label))
+
+        order = columns[sort].desc() if descending else columns[sort].asc()
+        rows = self.session.execute(
+            stmt.order_by(order, Document.document_id).limit(limit).offset(offset)
+        ).all()
+        total = rows[0][-1] if rows else 0
+        return pd.DataFrame([r[:-1] for r in rows], columns=SUMMARY_COLUMNS), total
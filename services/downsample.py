@@ -0,0 +1,47 @@
+import numpy as np
+
+# Giảm số điểm của chuỗi thời gian trước khi gửi sang trình duyệt: biểu đồ
+# rộng ~1.500 px không hiển thị được nhiều điểm hơn, còn JSON của figure và
+# thời gian vẽ tăng theo số điểm.
+
+
+def lttb_indices(x, y, n):
+    """Largest-Triangle-Three-Buckets: chỉ số của n điểm giữ dáng đường (x tăng dần).
+
+    Giữ điểm đầu / cuối; mỗi bucket ở giữa chọn điểm tạo tam giác lớn nhất với
+    điểm đã chọn trước đó và trung bình của bucket kế tiếp, nên đỉnh / đáy
+    nhọn không bị làm phẳng như khi lấy trung bình."""
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    edges = np.linspace(1, size - 1, n - 1).astype("int64")
+
+    indices = np.empty(n, dtype="int64")
+    indices[0], indices[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < n - 1 else size
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def downsample(x, y, n):
+    """(x, y) còn tối đa n điểm; x có thể là ngày (datetime64)"""
+    x, y = np.asarray(x), np.asarray(y)
+    if len(x) <= n:
+        return x, y
+    numeric_x = x.astype("datetime64[ns]").astype("int64") if x.dtype.kind == "M" else x
+    idx = lttb_indices(numeric_x, y, n)
+    return x[idx], y[idx]
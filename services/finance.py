@@ -0,0 +1,204 @@
+import pandas as pd
+from sqlalchemy import case, func
+from models import Personal_Spending, ChatHistory
+from search import normalize_text
+from services.money import to_money
+from services.archive import transaction_source
+
+TYPES = ["Thu nhập", "Chi tiêu"]
+SUMMARY_COLUMNS = ["Ngày", "Loại", "Danh mục", "Số tiền", "Thu", "Chi"]
+# Độ chi tiết của chuỗi thời gian -> biểu thức SQLite ra ngày đầu kỳ
+SERIES_PERIODS = {
+    "day": lambda d: func.date(d),
+    "week": lambda d: func.date(d, "weekday 0", "-6 days"),
+}
+
+
+# HELPERS
+def add_period_columns(df):
+    df["Ngày"] = pd.to_datetime(df["Ngày"])
+    df["Tháng"] = df["Ngày"].dt.strftime("%b-%Y")
+    df["Năm"] = df["Ngày"].dt.year
+    return df
+
+
+def monthly_summary(df):
+    monthly = df.groupby("Tháng")[["Thu", "Chi"]].sum().reset_index()
+    monthly["Tổng"] = monthly["Thu"] - monthly["Chi"]
+    return monthly
+
+
+def yearly_summary(df):
+    yearly = df.groupby("Năm")[["Thu", "Chi"]].sum().reset_index()
+    yearly["Tổng"] = yearly["Thu"] - yearly["Chi"]
+    return yearly
+
+
+def build_financial_context(df):
+    monthly = df.groupby("Tháng")[["Thu", "Chi"]].sum()
+    yearly = df.groupby("Năm")[["Thu", "Chi"]].sum()
+    category = df.groupby("Danh mục")[["Thu", "Chi"]].sum()
+
+    total_income = df["Thu"].sum()
+    total_expense = df["Chi"].sum()
+
+    saving_rate = 0
+    if total_income > 0:
+        saving_rate = (total_income - total_expense) / total_income * 100
+
+    return f"""
+Tổng thu: {total_income:,.0f}
+Tổng chi: {total_expense:,.0f}
+Tỉ lệ tiết kiệm: {saving_rate:.2f}%
+
+Theo tháng:
+{monthly.to_string()}
+
+Theo năm:
+{yearly.to_string()}
+
+Theo danh mục:
+{category.to_string()}
+"""
+
+
+# REPOSITORY
+class TransactionRepository:
+    def __init__(self, session):
+        self.session = session
+
+    def add(self, amount, type_, category, transaction_date):
+        t = Personal_Spending(
+            amount=to_money(amount),
+            type=type_,
+            category=category,
+            transaction_date=transaction_date
+        )
+        self.session.add(t)
+        return t
+
+    def update(self, t, amount, type_, category, transaction_date):
+        t.amount = to_money(amount)
+        t.type = type_
+        t.category = category
+        t.transaction_date = transaction_date
+        return t
+
+    def delete(self, t):
+        self.session.delete(t)
+
+    def get(self, transaction_id):
+        return self.session.get(Personal_Spending, transaction_id)
+
+    def count(self):
+        return self.session.query(Personal_Spending).count()
+
+    def recent(self, limit=None):
+        query = self.session.query(Personal_Spending).order_by(
+            Personal_Spending.transaction_date.desc()
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+
+    def fetch_data(self, include_archive=False):
+        t = transaction_source(include_archive)
+        rows = (
+            self.session.query(t.transaction_date, t.type, t.category, t.amount)
+            .order_by(t.transaction_date.desc())
+            .all()
+        )
+        if not rows:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(rows, columns=["Ngày", "Loại", "Danh mục", "Số tiền"])
+        df["Số tiền"] = df["Số tiền"].fillna(0).astype("int64")
+        df["Thu"] = df["Số tiền"].where(df["Loại"] == "Thu nhập", 0)
+        df["Chi"] = df["Số tiền"].where(df["Loại"] == "Chi tiêu", 0)
+
+        return df
+
+    def summary_page(self, sort="Ngày", descending=True, query=None, type_=None,
+                     include_archive=False, limit=50, offset=0):
+        """Một trang danh sách giao dịch, sắp xếp / lọc trong SQL.
+        Trả về (DataFrame cột số, tổng số dòng khớp bộ lọc)."""
+        t = transaction_source(include_archive)
+        income = case((t.type == "Thu nhập", t.amount), else_=0)
+        expense = case((t.type == "Chi tiêu", t.amount), else_=0)
+        columns = {
+            "Ngày": t.transaction_date,
+            "Loại": t.type,
+            "Danh mục": t.category,
+            "Số tiền": t.amount,
+            "Thu": income,
+            "Chi": expense,
+        }
+        query_ = self.session.query(*columns.values(), func.count().over())
+        if query:
+            query_ = query_.filter(
+                func.unaccent(t.category)
+                .contains(normalize_text(query).strip(), autoescape=True)
+            )
+        if type_:
+            query_ = query_.filter(t.type == type_)
+
+        order = columns[sort].desc() if descending else columns[sort].asc()
+        rows = (
+            query_.order_by(order, t.transaction_id.desc())
+            .limit(limit)
+            .offset(offset)
+            .all()
+        )
+        total = rows[0][-1] if rows else 0
+
+        df = pd.DataFrame([r[:-1] for r in rows], columns=SUMMARY_COLUMNS)
+        money = ["Số tiền", "Thu", "Chi"]
+        df[money] = df[money].fillna(0).astype("int64")
+        return df, total
+
+    def date_bounds(self, include_archive=False):
+        """(ngày đầu, ngày cuối) có giao dịch, hoặc None khi chưa có"""
+        t = transaction_source(include_archive)
+        first, last = self.session.query(
+            func.min(t.transaction_date), func.max(t.transaction_date)
+        ).one()
+        return (first, last) if first else None
+
+    def series(self, start=None, end=None, period="day", include_archive=False):
+        """Thu / Chi theo ngày hoặc tuần trong [start, end], cộng trong SQL"""
+        t = transaction_source(include_archive)
+        key = SERIES_PERIODS[period](t.transaction_date).label("period")
+        query = self.session.query(
+            key,
+            func.sum(case((t.type == "Thu nhập", t.amount), else_=0)),
+            func.sum(case((t.type == "Chi tiêu", t.amount), else_=0)),
+        )
+        if start is not None:
+            query = query.filter(t.transaction_date >= start)
+        if end is not None:
+            query = query.filter(t.transaction_date <= end)
+        rows = query.group_by(key).order_by(key).all()
+
+        df = pd.DataFrame(rows, columns=["Ngày", "Thu", "Chi"])
+        df["Ngày"] = pd.to_datetime(df["Ngày"])
+        df = df.astype({"Thu": "int64", "Chi": "int64"})
+        df["Tổng"] = df["Thu"] - df["Chi"]
+        return df
+
+
+class ChatRepository:
+    def __init__(self, session):
+        self.session = session
+
+    def add(self, question, answer):
+        h = ChatHistory(question=question, answer=answer)
+        self.session.add(h)
+        return h
+
+    def recent(self, limit=10):
+        return (
+            self.session.query(ChatHistory)
+            .order_by(ChatHistory.created_at.desc())
+            .limit(limit)
+            .all()
+        )
@@ -0,0 +1,107 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from models import ImportedFile
+from services.invoices import InvoiceRepository, parse_frame
+
+# Đọc + kiểm tra nhiều file Excel song song: openpyxl tốn CPU và bị GIL giới
+# hạn nên mỗi file chạy trong một process riêng. Ghi DB vẫn ở process chính,
+# trong một transaction duy nhất.
+#
+# Import lại là an toàn: file đã import (theo sha256 nội dung) bị bỏ qua, còn
+# dòng hoá đơn được upsert theo khoá tự nhiên (NCC, sản phẩm, tháng).
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def file_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def split_new_files(session, files):
+    """files: [(tên file, bytes)] -> (file chưa import, tên file đã import)"""
+    hashes = [file_hash(content) for _, content in files]
+    seen = {
+        h for (h,) in session.query(ImportedFile.content_hash)
+        .filter(ImportedFile.content_hash.in_(set(hashes)))
+    }
+    new, skipped = [], []
+    for (name, content), h in zip(files, hashes):
+        if h in seen:
+            skipped.append(name)
+        else:
+            # Cùng một file chọn hai lần trong một lần tải lên
+            seen.add(h)
+            new.append((name, content))
+    return new, skipped
+
+
+def parse_workbook(name, content):
+    """Chạy trong process con: chỉ nhận / trả dữ liệu picklable"""
+    try:
+        df = pd.read_excel(io.BytesIO(content))
+    except Exception as e:
+        return {"file": name, "hash": file_hash(content), "rows": [],
+                "errors": [f"Không đọc được file: {e}"]}
+    rows, errors = parse_frame(df)
+    return {"file": name, "hash": file_hash(content), "rows": rows, "errors": errors}
+
+
+def _get_pool():
+    # Giữ pool sống giữa các lần rerun để không phải spawn lại process.
+    # Dùng "spawn" vì fork một process Streamlit đang có nhiều thread dễ treo.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def parse_workbooks(files, parallel=True):
+    """files: [(tên file, bytes)] -> báo cáo theo file, cùng thứ tự"""
+    if not parallel or len(files) < 2:
+        return [parse_workbook(name, content) for name, content in files]
+
+    names, contents = zip(*files)
+    return list(_get_pool().map(parse_workbook, names, contents))
+
+
+def commit_reports(session, reports):
+    """Ghi mọi file nếu không file nào lỗi. Trả về None nếu không ghi, ngược
+    lại {"rows": số dòng đọc được, "written": số dòng thêm / thay đổi,
+    "archived": số dòng bỏ qua vì hoá đơn đã lưu trữ, "paid_lower": số dòng
+    bỏ qua vì "Đã trả" thấp hơn sổ}"""
+    if any(r["errors"] for r in reports):
+        session.rollback()
+        return None
+
+    repo = InvoiceRepository(session)
+    rows = written = archived = paid_lower = 0
+    try:
+        for r in reports:
+            if r["rows"]:
+                result = repo.upsert_rows(r["rows"])
+                written += result["written"]
+                archived += result["archived"]
+                paid_lower += result["paid_lower"]
+            rows += len(r["rows"])
+            session.add(ImportedFile(
+                content_hash=r["hash"],
+                file_name=r["file"],
+                row_count=len(r["rows"])
+            ))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return {
+        "rows": rows, "written": written, "archived": archived, "paid_lower": paid_lower
+    }
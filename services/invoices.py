@@ -0,0 +1,594 @@
+import pandas as pd
+from datetime import date, datetime
+from sqlalchemy import BigInteger, Date, String, bindparam, case, func, insert, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import Supplier, Product, Invoice, Payment, SupplierBalance, ArchivedInvoice
+from services.money import to_money
+from services.archive import invoice_source
+from search import normalize_text
+
+IMPORT_COLUMNS = ["Nhà cung cấp", "Sản phẩm", "Tháng", "Giá", "Số lượng", "Đã trả"]
+NATURAL_KEY = ["supplier_id", "product_id", "invoice_month"]
+UPSERT_CHUNK = 10_000
+IMPORT_PAYMENT_NOTE = "Điều chỉnh theo file import"
+SUMMARY_COLUMNS = [
+    "Nhà cung cấp", "Sản phẩm", "Tháng", "Giá", "Số lượng",
+    "Tổng tiền", "Đã trả", "Còn nợ",
+]
+# Nhóm tuổi nợ: (tên cột, số ngày tối thiểu tính từ đầu tháng hoá đơn)
+AGING_BUCKETS = [("Trong hạn", 0), ("30 ngày", 30), ("60 ngày", 60), ("90+ ngày", 90)]
+AGING_COLUMNS = [
+    "Nhà cung cấp", "Sản phẩm", "Tháng cũ nhất",
+    *[name for name, _ in AGING_BUCKETS],
+    "Còn nợ", "Luỹ kế NCC", "Nợ NCC",
+]
+
+
+# HELPERS
+def calculate(price, quantity, paid):
+    total = price * quantity
+    debt = total - paid
+    return total, debt
+
+
+def validate_invoice(price, quantity, paid):
+    if price < 0:
+        return False, "Giá không hợp lệ"
+    if quantity <= 0:
+        return False, "Số lượng phải > 0"
+    if paid < 0:
+        return False, "Đã trả không hợp lệ"
+    if paid > price * quantity:
+        return False, "Đã trả > Tổng tiền"
+    return True, ""
+
+
+def to_date(value):
+    """Chuyển giá trị invoice_month sang datetime.date"""
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            # Nếu chỉ là YYYY-MM
+            return datetime.strptime(value + "-01", "%Y-%m-%d").date()
+    elif isinstance(value, pd.Timestamp):
+        return value.date()
+    elif isinstance(value, datetime):
+        return value.date()
+    else:
+        return value
+
+
+def month_key(value):
+    """Tháng hoá đơn dạng 'YYYY-MM-01' (một phần của khoá tự nhiên)"""
+    return to_date(value).replace(day=1).isoformat()
+
+
+def parse_frame(df):
+    """Kiểm tra DataFrame Excel, trả về (các dòng hợp lệ, lỗi theo dòng)"""
+    missing = [c for c in IMPORT_COLUMNS if c not in df.columns]
+    if missing:
+        return [], [f"Thiếu cột: {', '.join(missing)}"]
+
+    rows, errors = [], []
+    for idx, row in df.iterrows():
+        try:
+            price = to_money(row["Giá"])
+            quantity = int(row["Số lượng"])
+            paid = to_money(row["Đã trả"])
+        except (TypeError, ValueError):
+            errors.append(f"Dòng {idx + 1}: Giá / Số lượng / Đã trả không hợp lệ")
+            continue
+
+        valid, msg = validate_invoice(price, quantity, paid)
+        if not valid:
+            errors.append(f"Dòng {idx + 1}: {msg}")
+            continue
+
+        supplier_name, product_name = (
+            "" if pd.isna(row[c]) else str(row[c]).strip()
+            for c in ("Nhà cung cấp", "Sản phẩm")
+        )
+        if not supplier_name or not product_name:
+            errors.append(f"Dòng {idx + 1}: Nhà cung cấp / Sản phẩm không được để trống")
+            continue
+
+        try:
+            month = month_key(row["Tháng"])
+        except (TypeError, ValueError, AttributeError):
+            errors.append(f"Dòng {idx + 1}: Tháng không hợp lệ")
+            continue
+
+        rows.append({
+            "supplier_name": supplier_name,
+            "product_name": product_name,
+            "month": month,
+            "price": price,
+            "quantity": quantity,
+            "paid": paid,
+        })
+    return rows, errors
+
+
+def export_frame(data):
+    """DataFrame xuất Excel từ các dòng (Invoice, Supplier, Product)"""
+    return pd.DataFrame([{
+        "Nhà cung cấp": s.supplier_name,
+        "Sản phẩm": p.product_name,
+        "Tháng": i.invoice_month,
+        "Giá": i.price,
+        "Số lượng": i.quantity,
+        "Tổng tiền": i.total_amount,
+        "Đã trả": i.total_paid,
+        "Còn nợ": i.total_debt
+    } for i, s, p in data])
+
+
+# REPOSITORY
+class InvoiceRepository:
+    def __init__(self, session):
+        self.session = session
+
+    def get_or_create_supplier_product(self, supplier_name, product_name):
+        supplier_name = supplier_name.strip()
+        product_name = product_name.strip()
+
+        if not supplier_name or not product_name:
+            raise ValueError("Nhà cung cấp / Sản phẩm không được để trống")
+
+        supplier = self.session.query(Supplier).filter_by(
+            supplier_name=supplier_name
+        ).first()
+
+        if not supplier:
+            supplier = Supplier(supplier_name=supplier_name)
+            self.session.add(supplier)
+            self.session.flush()
+
+        product = self.session.query(Product).filter_by(
+            product_name=product_name,
+            supplier_id=supplier.supplier_id
+        ).first()
+
+        if not product:
+            product = Product(
+                product_name=product_name,
+                supplier_id=supplier.supplier_id
+            )
+            self.session.add(product)
+            self.session.flush()
+
+        return supplier, product
+
+    def find(self, supplier_id, product_id, month):
+        return self.session.query(Invoice).filter_by(
+            supplier_id=supplier_id,
+            product_id=product_id,
+            invoice_month=month_key(month)
+        ).first()
+
+    def is_archived(self, supplier_id, product_id, month):
+        """Khoá tự nhiên đã thuộc một hoá đơn đã lưu trữ"""
+        a = ArchivedInvoice.c
+        return self.session.execute(
+            select(a.invoice_id).where(
+                a.supplier_id == supplier_id,
+                a.product_id == product_id,
+                a.invoice_month == month_key(month),
+            ).limit(1)
+        ).first() is not None
+
+    def add(self, supplier_name, product_name, month, price, quantity, paid):
+        supplier, product = self.get_or_create_supplier_product(
+            supplier_name,
+            product_name
+        )
+        if self.find(supplier.supplier_id, product.product_id, month):
+            raise ValueError("Hoá đơn của NCC / sản phẩm / tháng này đã có – hãy sửa trong danh sách")
+        if self.is_archived(supplier.supplier_id, product.product_id, month):
+            raise ValueError("Hoá đơn của NCC / sản phẩm / tháng này đã trả đủ và được lưu trữ")
+
+        price, paid = to_money(price), to_money(paid)
+        total = price * int(quantity)
+
+        invoice = Invoice(
+            supplier_id=supplier.supplier_id,
+            product_id=product.product_id,
+            invoice_month=month_key(month),
+            price=price,
+            quantity=int(quantity),
+            total_amount=total,
+            total_paid=0,
+            total_debt=total
+        )
+        self.session.add(invoice)
+        self.session.flush()
+        if paid:
+            self.add_payment(invoice, paid)
+        return invoice
+
+    # THANH TOÁN
+    def add_payment(self, invoice, amount, payment_date=None, note=None):
+        amount = to_money(amount)
+        if amount <= 0:
+            raise ValueError("Số tiền thanh toán phải > 0")
+        if amount > invoice.total_debt:
+            raise ValueError("Số tiền thanh toán > Còn nợ")
+
+        payment = Payment(
+            invoice_id=invoice.invoice_id,
+            payment_date=payment_date or date.today(),
+            amount=amount,
+            note=note
+        )
+        self.session.add(payment)
+        self.session.flush()
+        # Trigger đã cập nhật total_paid / total_debt trong DB
+        self.session.expire(invoice, ["total_paid", "total_debt"])
+        return payment
+
+    def delete_payment(self, payment):
+        invoice = payment.invoice
+        self.session.delete(payment)
+        self.session.flush()
+        self.session.expire(invoice, ["total_paid", "total_debt", "payments"])
+
+    def payments_by_invoice(self, invoice_ids=None):
+        """{invoice_id: [Payment, ...]} theo ngày trả, một truy vấn"""
+        query = self.session.query(Payment)
+        if invoice_ids is not None:
+            query = query.filter(Payment.invoice_id.in_(invoice_ids))
+        result = {}
+        for p in query.order_by(Payment.payment_date, Payment.payment_id):
+            result.setdefault(p.invoice_id, []).append(p)
+        return result
+
+    def resolve_parties(self, pairs):
+        """{(tên NCC, tên sản phẩm)} -> {(tên NCC, tên sản phẩm): (supplier_id, product_id)},
+        tạo NCC / sản phẩm còn thiếu; số truy vấn không phụ thuộc số dòng"""
+        names = {s for s, _ in pairs}
+        suppliers = dict(
+            self.session.query(Supplier.supplier_name, Supplier.supplier_id)
+            .filter(Supplier.supplier_name.in_(names))
+        )
+        missing = [Supplier(supplier_name=n) for n in names - suppliers.keys()]
+        if missing:
+            self.session.add_all(missing)
+            self.session.flush()
+            suppliers.update({s.supplier_name: s.supplier_id for s in missing})
+
+        products = {
+            (supplier_id, name): product_id
+            for product_id, name, supplier_id in
+            self.session.query(Product.product_id, Product.product_name, Product.supplier_id)
+            .filter(Product.supplier_id.in_(set(suppliers.values())))
+        }
+        missing = [
+            Product(product_name=p, supplier_id=suppliers[s])
+            for s, p in pairs if (suppliers[s], p) not in products
+        ]
+        if missing:
+            self.session.add_all(missing)
+            self.session.flush()
+            products.update({(p.supplier_id, p.product_name): p.product_id for p in missing})
+
+        return {(s, p): (suppliers[s], products[(suppliers[s], p)]) for s, p in pairs}
+
+    def upsert_rows(self, rows):
+        """Ghi các dòng đã kiểm tra bởi parse_frame theo khoá tự nhiên
+        (NCC, sản phẩm, tháng): dòng mới được thêm, dòng đổi giá / số lượng
+        được cập nhật tại chỗ, dòng không đổi được bỏ qua. Cột "Đã trả" của
+        file là số đã trả luỹ kế: phần chênh với sổ được ghi thành một khoản
+        thanh toán điều chỉnh. Khoá thuộc hoá đơn đã lưu trữ (đã trả đủ) và
+        dòng có "Đã trả" thấp hơn sổ (khoản điều chỉnh âm) bị bỏ qua. Trả về
+        {"written": số hoá đơn thực sự thay đổi, "archived": số dòng bỏ qua
+        vì đã lưu trữ, "paid_lower": số dòng bỏ qua vì "Đã trả" thấp hơn sổ}."""
+        parties = self.resolve_parties({(r["supplier_name"], r["product_name"]) for r in rows})
+
+        values = {}
+        for r in rows:
+            supplier_id, product_id = parties[(r["supplier_name"], r["product_name"])]
+            # Trùng khoá trong cùng file: dòng sau thắng
+            values[(supplier_id, product_id, r["month"])] = r
+
+        # Hiện trạng của các hoá đơn liên quan, đọc qua index khoá tự nhiên
+        supplier_ids = {k[0] for k in values}
+        product_ids = list({k[1] for k in values})
+        existing, archived = {}, set()
+        a = ArchivedInvoice.c
+        for start in range(0, len(product_ids), UPSERT_CHUNK):
+            chunk = product_ids[start:start + UPSERT_CHUNK]
+            existing.update({
+                (s, p, m): (price, quantity, paid or 0)
+                for s, p, m, price, quantity, paid in self.session.execute(
+                    select(
+                        Invoice.supplier_id, Invoice.product_id, Invoice.invoice_month,
+                        Invoice.price, Invoice.quantity, Invoice.total_paid
+                    ).where(
+                        Invoice.supplier_id.in_(supplier_ids),
+                        Invoice.product_id.in_(chunk)
+                    )
+                )
+            })
+            archived.update(self.session.execute(
+                select(a.supplier_id, a.product_id, a.invoice_month).where(
+                    a.supplier_id.in_(supplier_ids), a.product_id.in_(chunk)
+                )
+            ).tuples())
+        archived &= values.keys()
+        for key in archived:
+            del values[key]
+
+        # Số đã trả chỉ giảm khi xoá thanh toán trên trang, không qua import
+        paid_lower = {
+            key for key, r in values.items()
+            if key in existing and r["paid"] < existing[key][2]
+        }
+        for key in paid_lower:
+            del values[key]
+
+        invoices, payments = [], []
+        for key, r in values.items():
+            old = existing.get(key)
+            if old is None or old[:2] != (r["price"], r["quantity"]):
+                total = r["price"] * r["quantity"]
+                invoices.append({
+                    "supplier_id": key[0],
+                    "product_id": key[1],
+                    "invoice_month": key[2],
+                    "price": r["price"],
+                    "quantity": r["quantity"],
+                    "total_amount": total,
+                    "total_paid": 0,
+                    "total_debt": total,
+                })
+            paid = old[2] if old else 0
+            if r["paid"] != paid:
+                payments.append({
+                    "k_supplier": key[0],
+                    "k_product": key[1],
+                    "k_month": key[2],
+                    "p_amount": r["paid"] - paid,
+                })
+
+        table = Invoice.__table__
+        upsert = sqlite_insert(table)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=NATURAL_KEY,
+            set_={
+                "price": upsert.excluded.price,
+                "quantity": upsert.excluded.quantity,
+                "total_amount": upsert.excluded.total_amount,
+                "total_debt": upsert.excluded.total_amount - table.c.total_paid,
+            }
+        )
+        # Khoản điều chỉnh gắn vào hoá đơn theo khoá tự nhiên (sau upsert
+        # nên hoá đơn mới cũng đã có id); trigger ledger cập nhật số dư
+        adjust = insert(Payment.__table__).from_select(
+            ["invoice_id", "payment_date", "amount", "note"],
+            select(
+                Invoice.invoice_id,
+                bindparam("p_date", date.today(), type_=Date),
+                bindparam("p_amount", type_=BigInteger),
+                bindparam("p_note", IMPORT_PAYMENT_NOTE, type_=String),
+            ).where(
+                Invoice.supplier_id == bindparam("k_supplier"),
+                Invoice.product_id == bindparam("k_product"),
+                Invoice.invoice_month == bindparam("k_month"),
+            )
+        )
+        for stmt, params in ((upsert, invoices), (adjust, payments)):
+            for start in range(0, len(params), UPSERT_CHUNK):
+                self.session.execute(stmt, params[start:start + UPSERT_CHUNK])
+
+        written = len(
+            {(v["supplier_id"], v["product_id"], v["invoice_month"]) for v in invoices}
+            | {(p["k_supplier"], p["k_product"], p["k_month"]) for p in payments}
+        )
+        return {
+            "written": written, "archived": len(archived), "paid_lower": len(paid_lower)
+        }
+
+    def import_frame(self, df):
+        """Ghi hoá đơn từ DataFrame Excel, trả về danh sách lỗi theo dòng"""
+        rows, errors = parse_frame(df)
+        if rows:
+            self.upsert_rows(rows)
+        return errors
+
+    def update(self, invoice, price, quantity, month):
+        """Sửa giá / số lượng / tháng; số đã trả chỉ đổi qua add_payment"""
+        price, quantity = to_money(price), int(quantity)
+        total = price * quantity
+        paid = invoice.total_paid or 0
+        if total < paid:
+            raise ValueError("Tổng tiền < số đã trả")
+
+        month = month_key(month)
+        if month != invoice.invoice_month:
+            other = self.find(invoice.supplier_id, invoice.product_id, month)
+            if other is not None and other.invoice_id != invoice.invoice_id:
+                raise ValueError("Đã có hoá đơn khác của NCC / sản phẩm ở tháng này")
+            if self.is_archived(invoice.supplier_id, invoice.product_id, month):
+                raise ValueError("Hoá đơn của NCC / sản phẩm ở tháng này đã được lưu trữ")
+
+        invoice.quantity = quantity
+        invoice.price = price
+        invoice.total_amount = total
+        # total_paid đọc trong câu UPDATE: trigger ledger có thể đã đổi nó
+        # sau khi invoice được nạp
+        invoice.total_debt = total - Invoice.total_paid
+        invoice.invoice_month = month
+        return invoice
+
+    def delete(self, invoice):
+        self.session.delete(invoice)
+
+    def count(self):
+        return self.session.query(Invoice).count()
+
+    def list_with_parties(self, include_archive=False, limit=None, offset=0):
+        inv = invoice_source(include_archive)
+        query = (
+            self.session.query(inv, Supplier, Product)
+            .select_from(inv)
+            .join(Supplier, inv.supplier_id == Supplier.supplier_id)
+            .join(Product, inv.product_id == Product.product_id)
+            .order_by(inv.invoice_id.desc())
+        )
+        if limit is not None:
+            query = query.limit(limit).offset(offset)
+        return query.all()
+
+    def get_with_parties(self, invoice_id):
+        """(Invoice, Supplier, Product) của một hoá đơn, None nếu đã bị xoá"""
+        return (
+            self.session.query(Invoice, Supplier, Product)
+            .join(Supplier, Invoice.supplier_id == Supplier.supplier_id)
+            .join(Product, Invoice.product_id == Product.product_id)
+            .filter(Invoice.invoice_id == invoice_id)
+            .one_or_none()
+        )
+
+    # Tổng hợp bằng SUM số nguyên trong SQL
+    def totals(self, include_archive=False):
+        inv = invoice_source(include_archive)
+        total, paid, debt = self.session.query(
+            func.coalesce(func.sum(inv.total_amount), 0),
+            func.coalesce(func.sum(inv.total_paid), 0),
+            func.coalesce(func.sum(inv.total_debt), 0),
+        ).one()
+        return {"Tổng tiền": total, "Đã trả": paid, "Còn nợ": debt}
+
+    def debt_by_supplier(self, include_archive=False):
+        # Số dư do trigger ledger duy trì; hoá đơn lưu trữ đều đã trả đủ nên
+        # include_archive không làm đổi kết quả
+        debt = SupplierBalance.outstanding_debt
+        rows = (
+            self.session.query(Supplier.supplier_name, debt)
+            .join(SupplierBalance, SupplierBalance.supplier_id == Supplier.supplier_id)
+            .filter(debt != 0)
+            .order_by(debt.desc())
+            .all()
+        )
+        return pd.DataFrame(rows, columns=["Nhà cung cấp", "Còn nợ"]).astype({"Còn nợ": "int64"})
+
+    def monthly_totals(self, include_archive=False):
+        inv = invoice_source(include_archive)
+        month = func.substr(inv.invoice_month, 1, 7).label("Tháng")
+        rows = (
+            self.session.query(
+                month,
+                func.sum(inv.total_amount),
+                func.sum(inv.total_debt),
+            )
+            .group_by(month)
+            .order_by(month)
+            .all()
+        )
+        return pd.DataFrame(rows, columns=["Tháng", "Tổng tiền", "Còn nợ"]).astype({
+            "Tổng tiền": "int64", "Còn nợ": "int64"
+        })
+
+    def aging_report(self, today=None, limit=50, offset=0):
+        """Tuổi nợ theo NCC / sản phẩm, tính hoàn toàn trong SQL.
+
+        Hoá đơn còn nợ được gom theo (NCC, sản phẩm) qua partial index
+        ix_invoices_open_debt, chia nhóm bằng CASE trên số ngày kể từ
+        invoice_month; luỹ kế và tổng nợ NCC là window function nên vẫn đúng
+        khi chỉ lấy một trang. Trả về (DataFrame của trang, tổng số dòng)."""
+        today = today or date.today()
+        age = func.julianday(today.isoformat()) - func.julianday(Invoice.invoice_month)
+        # Nhóm cao nhất mà tuổi hoá đơn đạt tới; dưới 30 ngày là trong hạn
+        bucket = case(
+            *[(age >= days, k) for k, (_, days) in reversed(list(enumerate(AGING_BUCKETS))) if days],
+            else_=0
+        )
+        debts = (
+            select(
+                Invoice.supplier_id,
+                Invoice.product_id,
+                func.min(Invoice.invoice_month).label("oldest"),
+                *[
+                    func.sum(case((bucket == k, Invoice.total_debt), else_=0)).label(f"b{k}")
+                    for k in range(len(AGING_BUCKETS))
+                ],
+                func.sum(Invoice.total_debt).label("debt"),
+            )
+            .where(Invoice.total_debt > 0)
+            .group_by(Invoice.supplier_id, Invoice.product_id)
+            .subquery()
+        )
+
+        order = [Supplier.supplier_name, debts.c.supplier_id, Product.product_name, debts.c.product_id]
+        stmt = (
+            select(
+                Supplier.supplier_name,
+                Product.product_name,
+                debts.c.oldest,
+                *[debts.c[f"b{k}"] for k in range(len(AGING_BUCKETS))],
+                debts.c.debt,
+                func.sum(debts.c.debt).over(
+                    partition_by=debts.c.supplier_id, order_by=order[2:], rows=(None, 0)
+                ),
+                func.sum(debts.c.debt).over(partition_by=debts.c.supplier_id),
+                func.count().over(),
+            )
+            .join_from(debts, Supplier, Supplier.supplier_id == debts.c.supplier_id)
+            .join(Product, Product.product_id == debts.c.product_id)
+            .order_by(*order)
+            .limit(limit)
+            .offset(offset)
+        )
+        rows = self.session.execute(stmt).all()
+        total_rows = rows[0][-1] if rows else 0
+
+        df = pd.DataFrame([r[:-1] for r in rows], columns=AGING_COLUMNS)
+        money = AGING_COLUMNS[3:]
+        return df.astype({c: "int64" for c in money}), total_rows
+
+    def summary_page(self, sort="Tháng", descending=True, query=None,
+                     debt_only=False, limit=50, offset=0):
+        """Một trang bảng tổng hợp hoá đơn, sắp xếp / lọc trong SQL.
+        query: tìm trong tên NCC / sản phẩm (không phân biệt dấu).
+        Trả về (DataFrame cột số, tổng số dòng khớp bộ lọc)."""
+        columns = {
+            "Nhà cung cấp": Supplier.supplier_name,
+            "Sản phẩm": Product.product_name,
+            "Tháng": Invoice.invoice_month,
+            "Giá": Invoice.price,
+            "Số lượng": Invoice.quantity,
+            "Tổng tiền": Invoice.total_amount,
+            "Đã trả": Invoice.total_paid,
+            "Còn nợ": Invoice.total_debt,
+        }
+        stmt = (
+            select(
+                Supplier.supplier_name,
+                Product.product_name,
+                func.substr(Invoice.invoice_month, 1, 7),
+                *list(columns.values())[3:],
+                func.count().over(),
+            )
+            .join_from(Invoice, Supplier, Invoice.supplier_id == Supplier.supplier_id)
+            .join(Product, Invoice.product_id == Product.product_id)
+        )
+        if query:
+            term = normalize_text(query).strip()
+            stmt = stmt.where(or_(
+                func.unaccent(Supplier.supplier_name).contains(term, autoescape=True),
+                func.unaccent(Product.product_name).contains(term, autoescape=True),
+            ))
+        if debt_only:
+            stmt = stmt.where(Invoice.total_debt > 0)
+
+        order = columns[sort].desc() if descending else columns[sort].asc()
+        rows = self.session.execute(
+            stmt.order_by(order, Invoice.invoice_id.desc()).limit(limit).offset(offset)
+        ).all()
+        total = rows[0][-1] if rows else 0
+
+        df = pd.DataFrame([r[:-1] for r in rows], columns=SUMMARY_COLUMNS)
+        money = SUMMARY_COLUMNS[3:]
+        df[money] = df[money].fillna(0).astype("int64")
+        return df, total
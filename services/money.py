@@ -0,0 +1,14 @@
+import math
+
+# Tiền lưu dạng số nguyên đồng (BigInteger); chỉ định dạng khi hiển thị.
+
+
+def to_money(value):
+    """Chuyển số từ form / Excel sang số nguyên đồng: 1500.0 -> 1500"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        raise ValueError("Số tiền không hợp lệ")
+    return int(round(float(value)))
+
+
+def format_money(value):
+    return f"{int(value or 0):,}"
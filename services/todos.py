@@ -0,0 +1,42 @@
+from models import Todo
+
+
+# HELPERS
+def validate_task(task: str):
+    if not task:
+        return False, "❌ Vui lòng nhập task"
+    return True, ""
+
+
+# REPOSITORY
+class TodoRepository:
+    def __init__(self, session):
+        self.session = session
+
+    def add(self, task, due_date):
+        todo = Todo(task=task, due_date=due_date)
+        self.session.add(todo)
+        return todo
+
+    def get(self, todo_id):
+        return self.session.get(Todo, todo_id)
+
+    def for_date(self, due_date):
+        return (
+            self.session.query(Todo)
+            .filter(Todo.due_date == due_date)
+            .order_by(Todo.due_date)
+            .all()
+        )
+
+    def set_done(self, todo, done):
+        todo.is_done = done
+        return todo
+
+    def update(self, todo, task, due_date):
+        todo.task = task
+        todo.due_date = due_date
+        return todo
+
+    def delete(self, todo):
+        self.session.delete(todo)
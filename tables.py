@@ -0,0 +1,61 @@
+import streamlit as st
+
+# Bảng tổng hợp phân trang phía server cho các trang Streamlit.
+#
+# Repository trả về đúng một trang (DataFrame kiểu số / ngày) cùng tổng số
+# dòng; sắp xếp và lọc nằm trong câu SQL. Định dạng hiển thị (dấu phân cách
+# nghìn, ngày dd/mm/yyyy) do column_config đảm nhận nên cột vẫn là số và
+# sắp xếp trên trình duyệt vẫn đúng.
+
+PAGE_SIZE = 50
+
+
+def money_column(label):
+    return st.column_config.NumberColumn(label, format="localized")
+
+
+def date_column(label):
+    return st.column_config.DateColumn(label, format="DD/MM/YYYY")
+
+
+def _page_key(key):
+    return f"{key}_page"
+
+
+def reset_page(key):
+    """on_change cho widget lọc / sắp xếp: quay về trang 1"""
+    st.session_state.pop(_page_key(key), None)
+
+
+def sort_controls(key, columns, default, descending=False):
+    """(cột sắp xếp, giảm dần?) cho bảng key"""
+    c1, c2 = st.columns([4, 1])
+    sort = c1.selectbox(
+        "Sắp xếp theo", columns, index=columns.index(default),
+        key=f"{key}_sort", on_change=reset_page, args=(key,)
+    )
+    desc = c2.toggle(
+        "Giảm dần", value=descending,
+        key=f"{key}_desc", on_change=reset_page, args=(key,)
+    )
+    return sort, desc
+
+
+def page_offset(key, page_size=PAGE_SIZE):
+    """OFFSET của trang hiện tại; đọc trước khi truy vấn"""
+    return (st.session_state.get(_page_key(key), 1) - 1) * page_size
+
+
+def page_footer(key, total, page_size=PAGE_SIZE, label="dòng"):
+    """Chọn trang sau khi đã có tổng số dòng từ truy vấn"""
+    if not total:
+        if st.session_state.get(_page_key(key), 1) > 1:
+            # Trang cũ vượt quá số dòng sau khi xoá / lọc
+            reset_page(key)
+            st.rerun()
+        return
+
+    pages = -(-total // page_size)
+    c1, c2 = st.columns([2, 8])
+    c1.number_input("Trang", min_value=1, max_value=pages, key=_page_key(key))
+    c2.caption(f"{total:,} {label} · {pages} trang")